@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+"""Microbenchmark and correctness check for the banner layout engine.
+
+Generates thousands of synthetic multi-monitor topologies, checks that
+every banner lands where it should and times cold, memoized and batched
+layout evaluation. No X server is needed.
+
+    python benchmarks/bench_layout.py --topologies 5000
+"""
+
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from classification_banner.geometry import Topology
+from classification_banner.layout import LAYOUT_OPTIONS, LayoutEngine, compute_layout
+
+RESOLUTIONS = [(1024, 768), (1280, 1024), (1366, 768), (1920, 1080),
+               (1920, 1200), (2560, 1440), (3840, 2160), (1080, 1920)]
+
+
+# Returns a random topology of monitors in a row, a column or a grid
+def synthetic_topology(rng):
+    count = rng.randint(1, 6)
+    columns = rng.choice([count, 1, 2])
+    monitors = []
+    x = y = row_height = 0
+    for i in range(count):
+        w, h = rng.choice(RESOLUTIONS)
+        if i and i % columns == 0:
+            x = 0
+            y += row_height
+            row_height = 0
+        monitors.append((x, y, w, h))
+        x += w
+        row_height = max(row_height, h)
+    width = max(mx + mw for mx, my, mw, mh in monitors)
+    height = max(my + mh for mx, my, mw, mh in monitors)
+    return Topology(width, height, tuple(monitors), 0)
+
+
+def synthetic_options(rng):
+    return Namespace(hres=0, vres=0,
+                     spanning=rng.random() < 0.2,
+                     taskbar_offset=rng.choice([0, 0, 48, 64]),
+                     banner_width=rng.choice([0, 0, 0, 800]),
+                     show_top=True,
+                     show_bottom=rng.random() < 0.8,
+                     watermark=False)
+
+
+# Returns a list of problems with a layout
+def check(topology, options, windows):
+    problems = []
+    if options.spanning or len(topology.monitors) == 1:
+        if len(topology.monitors) == 1:
+            areas = [(0, 0) + topology.monitors[0][2:]]
+        else:
+            areas = [(0, 0, topology.width, topology.height)]
+    else:
+        areas = list(topology.monitors)
+    expected = len(areas) * (int(options.show_top) + int(options.show_bottom))
+    if len(windows) != expected:
+        problems.append("%d windows instead of %d" % (len(windows), expected))
+    for window in windows:
+        x, y, w, h = areas[window.monitor]
+        if window.monitor == 0 and not options.spanning and len(areas) > 1:
+            w -= options.taskbar_offset
+        if options.banner_width > 0:
+            if window.width != options.banner_width:
+                problems.append("%r is not banner_width wide" % (window,))
+            if abs((window.x + window.width // 2) - (x + w // 2)) > 1:
+                problems.append("%r is not centered" % (window,))
+        elif (window.x, window.width) != (x, w):
+            problems.append("%r does not cover its monitor" % (window,))
+        edge = y if window.position == "top" else y + h
+        if window.y != edge:
+            problems.append("%r is not on the %s edge" % (window, window.position))
+    return problems
+
+
+def main():
+    parser = ArgumentParser(description="Layout engine microbenchmark")
+    parser.add_argument("--topologies", type=int, default=5000,
+                        help="Number of synthetic topologies")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Random seed")
+    options = parser.parse_args()
+
+    rng = random.Random(options.seed)
+    cases = [(synthetic_topology(rng), synthetic_options(rng))
+             for i in range(options.topologies)]
+
+    # Correctness
+    failures = 0
+    for topology, layout_options in cases:
+        problems = check(topology, layout_options,
+                         LayoutEngine().layout(topology, layout_options))
+        for problem in problems:
+            print("FAIL: %s: %s" % (topology.monitors, problem))
+        failures += bool(problems)
+
+    # Cost of computing every layout from scratch
+    start = time.time()
+    for topology, layout_options in cases:
+        compute_layout(topology, *[getattr(layout_options, name) for name in LAYOUT_OPTIONS])
+    cold = time.time() - start
+
+    # Cost of repeated screen-change signals for an unchanged layout
+    engine = LayoutEngine()
+    topology, layout_options = cases[0]
+    engine.layout(topology, layout_options)
+    start = time.time()
+    for i in range(len(cases)):
+        engine.layout(topology, layout_options)
+    warm = time.time() - start
+
+    # Batched evaluation of every topology with one set of options
+    topologies = [topology for topology, layout_options in cases]
+    start = time.time()
+    LayoutEngine().layout_many(topologies, cases[0][1])
+    batch = time.time() - start
+
+    count = float(len(cases))
+    print("topologies       %8d" % len(cases))
+    print("cold layout      %8.2f us/topology" % (cold / count * 1e6))
+    print("memoized layout  %8.2f us/call" % (warm / count * 1e6))
+    print("batched layout   %8.2f us/topology" % (batch / count * 1e6))
+    if failures:
+        print("FAIL: %d of %d layouts are wrong" % (failures, len(cases)))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+"""Memory of --multi-display against one banner per display.
+
+Starts --displays Xvfb servers and brings banners up on all of them
+twice: once as one classification-banner process per display, as on a
+terminal server without --multi-display, and once as a single
+--multi-display daemon whose children are forked from a zygote that
+loaded GTK. Once every display's first banner is mapped, the memory of
+each process tree is summed:
+
+  rss_kib   resident memory, counting shared pages once per process
+  pss_kib   proportional set size, splitting shared pages between the
+            processes that share them; the real cost on the host
+
+The run fails if the daemon does not use at least --min-gain less PSS
+than the separate banners.
+
+    python benchmarks/bench_multidisplay.py --displays 8
+    python benchmarks/bench_multidisplay.py --displays 20 --output results.json
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from bench_xvfb import Banner, Xvfb
+
+
+# Returns the pids of a process and all of its descendants
+def process_tree(pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % entry) as stat:
+                ppid = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (IOError, OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids = [pid]
+    for pid in pids:
+        pids.extend(children.get(pid, []))
+    return pids
+
+
+# Returns the (rss, pss) of a process in KiB
+def memory(pid):
+    rss = pss = 0
+    path = "/proc/%d/smaps_rollup" % pid
+    if not os.path.exists(path):
+        path = "/proc/%d/smaps" % pid
+    try:
+        with open(path) as smaps:
+            for line in smaps:
+                if line.startswith("Rss:"):
+                    rss += int(line.split()[1])
+                elif line.startswith("Pss:"):
+                    pss += int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return rss, pss
+
+
+# Returns the memory of the process trees of some banners
+def measure(banners, displays):
+    pids = []
+    for banner in banners:
+        pids.extend(process_tree(banner.process.pid))
+    rss = pss = 0
+    for pid in pids:
+        process_rss, process_pss = memory(pid)
+        rss += process_rss
+        pss += process_pss
+    return {
+        "processes": len(pids),
+        "rss_kib": rss,
+        "pss_kib": pss,
+        "pss_per_display": pss / float(displays),
+    }
+
+
+def run(names, args, multi_display, settle):
+    if multi_display:
+        banners = [Banner(names[0], args + ["--multi-display", "--displays", ",".join(names)])]
+    else:
+        banners = [Banner(name, args + ["--new-instance"]) for name in names]
+    try:
+        # Every display reports its start-up once its first banner is mapped
+        for i in range(len(names)):
+            banners[0 if multi_display else i].wait_for("total", timeout=60)
+        time.sleep(settle)
+        return measure(banners, len(names))
+    finally:
+        for banner in banners:
+            banner.stop()
+
+
+def main():
+    parser = ArgumentParser(description="Memory of --multi-display against one banner per display")
+    parser.add_argument("--displays", type=int, default=8,
+                        help="Number of Xvfb displays to serve")
+    parser.add_argument("--first-display", type=int, default=90,
+                        help="Display number of the first Xvfb server")
+    parser.add_argument("--settle", type=float, default=1.0,
+                        help="Seconds to wait after the last first map before measuring")
+    parser.add_argument("--min-gain", type=float, default=0.2,
+                        help="Fraction of PSS the daemon must save to pass")
+    parser.add_argument("--output", metavar="FILE",
+                        help="Write the results as JSON")
+    options = parser.parse_args()
+
+    # An empty configuration so that /etc/classification-banner does not
+    # influence the results
+    config = tempfile.NamedTemporaryFile(mode="w", suffix=".conf")
+    args = ["--config", config.name, "--startup-trace"]
+
+    names = [":%d" % (options.first_display + i) for i in range(options.displays)]
+    servers = [Xvfb(name, 1) for name in names]
+    try:
+        results = {
+            "displays": options.displays,
+            "separate": run(names, args, False, options.settle),
+            "multi_display": run(names, args, True, options.settle),
+        }
+    finally:
+        for server in servers:
+            server.stop()
+
+    separate, multi = results["separate"], results["multi_display"]
+    results["pss_gain"] = 1 - multi["pss_kib"] / float(separate["pss_kib"])
+    for mode in ("separate", "multi_display"):
+        print("%-14s %3d processes  rss %8d KiB  pss %8d KiB  pss/display %8.0f KiB" % (
+            mode, results[mode]["processes"], results[mode]["rss_kib"],
+            results[mode]["pss_kib"], results[mode]["pss_per_display"]))
+    print("pss gain %.0f%%" % (results["pss_gain"] * 100))
+
+    if options.output:
+        with open(options.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if results["pss_gain"] < options.min_gain:
+        print("FAIL: --multi-display saves less than %.0f%% of the PSS" % (options.min_gain * 100))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+"""Start-up, memory and relayout benchmarks against Xvfb.
+
+Every combination of backend (GTK or the lean python-xlib one),
+spanning, sys_info, esc, click_to_move and monitor count is run as a
+real classification-banner process on a local Xvfb server and measured
+for:
+
+  cold_start_ms     spawning the process until the first banner is mapped
+  first_map_ms      the banner's own --startup-trace total
+  rss_kib           resident memory once the banners are up
+  rss_per_window    rss_kib divided by the number of banner windows
+  relayout_ms       resizing the screen with xrandr until the banners
+                    have been laid out again (single monitor only, see below)
+
+Multiple monitors are emulated with Xinerama, which cannot be combined
+with RandR on Xvfb, so screen resizes are only measured with one
+monitor. Results are written as JSON and compared against a stored
+baseline; any metric more than --tolerance worse fails the run.
+
+    python benchmarks/bench_xvfb.py --output results.json
+    python benchmarks/bench_xvfb.py --update-baseline
+    python benchmarks/bench_xvfb.py --backends gtk,xlib --summary
+"""
+
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Banner options that make up the benchmark matrix
+FLAGS = [
+    ("spanning", "--enable-spanning"),
+    ("sys_info", "--system-info"),
+    ("esc", None),
+    ("click_to_move", "--enable-click_to_move"),
+]
+MONITORS = [1, 2, 3]
+BACKENDS = ["gtk", "xlib"]
+
+# Metrics compared against the baseline (lower is better)
+METRICS = ["cold_start_ms", "first_map_ms", "rss_kib", "rss_per_window", "relayout_ms"]
+
+# Screen sizes for the relayout measurement
+WIDTH, HEIGHT = 1920, 1080
+RESIZED = "1280x1024"
+
+# Started through bin/classification-banner, which picks the backend
+LAUNCH = ("import runpy, sys; sys.argv[0] = 'classification-banner'; "
+          "runpy.run_path(%r, run_name='__main__')" % os.path.join(ROOT, "bin", "classification-banner"))
+
+
+class Xvfb:
+    """A virtual X server with one screen per emulated monitor."""
+
+    def __init__(self, display, monitors):
+        self.display = display
+        command = ["Xvfb", display, "-nolisten", "tcp"]
+        for i in range(monitors):
+            command += ["-screen", str(i), "%dx%dx24" % (WIDTH, HEIGHT)]
+        if monitors > 1:
+            command.append("+xinerama")
+        else:
+            command += ["+extension", "RANDR"]
+        self.process = subprocess.Popen(command, stderr=open(os.devnull, "w"))
+        socket = "/tmp/.X11-unix/X%s" % display.lstrip(":")
+        for i in range(100):
+            if os.path.exists(socket):
+                break
+            time.sleep(0.05)
+
+    def xrandr(self, *args):
+        env = dict(os.environ, DISPLAY=self.display)
+        return subprocess.call(["xrandr"] + list(args), env=env,
+                               stdout=open(os.devnull, "w"),
+                               stderr=open(os.devnull, "w")) == 0
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+class Banner:
+    """A classification-banner process whose --startup-trace is followed."""
+
+    def __init__(self, display, args):
+        env = dict(os.environ, DISPLAY=display, PYTHONPATH=ROOT)
+        self.started = time.time()
+        self.process = subprocess.Popen([sys.executable, "-c", LAUNCH] + args,
+                                        env=env, stderr=subprocess.PIPE,
+                                        universal_newlines=True)
+        self.lines = Queue()
+        reader = threading.Thread(target=self.read)
+        reader.daemon = True
+        reader.start()
+
+    def read(self):
+        for line in iter(self.process.stderr.readline, ""):
+            if line.startswith("startup-trace:"):
+                phase, value = line[len("startup-trace:"):].rsplit(None, 2)[:2]
+                self.lines.put((time.time(), phase.strip(), float(value)))
+
+    # Returns (arrival time, value) of the next trace line for a phase
+    def wait_for(self, phase, timeout=30):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                arrived, name, value = self.lines.get(timeout=max(0, deadline - time.time()))
+            except Empty:
+                raise RuntimeError("no '%s' from the banner within %ds" % (phase, timeout))
+            if name == phase:
+                return arrived, value
+
+    def rss(self):
+        with open("/proc/%d/status" % self.process.pid) as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+        return 0
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def run_case(xvfb, case, config, settle):
+    args = ["--config", config, "--startup-trace", "--relayout-delay", "0",
+            "--new-instance", "--backend", case["backend"]]
+    for name, flag in FLAGS:
+        if name == "esc":
+            if not case["esc"]:
+                args.append("--disable-esc")
+        elif case[name]:
+            args.append(flag)
+
+    banner = Banner(xvfb.display, args)
+    try:
+        mapped, total = banner.wait_for("total")
+        result = {
+            "cold_start_ms": (mapped - banner.started) * 1000,
+            "first_map_ms": total,
+        }
+
+        # Let deferred monitors and system info settle before measuring
+        time.sleep(settle)
+        windows = 2 * (1 if case["spanning"] else case["monitors"])
+        result["rss_kib"] = banner.rss()
+        result["rss_per_window"] = result["rss_kib"] / float(windows)
+
+        result["relayout_ms"] = None
+        if case["monitors"] == 1 and xvfb.xrandr("--fb", RESIZED):
+            changed = time.time()
+            try:
+                arrived, duration = banner.wait_for("relayout", timeout=5)
+                result["relayout_ms"] = (arrived - changed) * 1000
+            except RuntimeError:
+                pass
+            xvfb.xrandr("--fb", "%dx%d" % (WIDTH, HEIGHT))
+    finally:
+        banner.stop()
+    return result
+
+
+def case_name(case):
+    return ",".join("%s=%s" % (key, case[key]) for key in sorted(case))
+
+
+# Returns the mean of each metric per backend
+def summarize(results):
+    summary = {}
+    for result in results.values():
+        backend = summary.setdefault(result["case"]["backend"], {})
+        for metric in METRICS:
+            if result.get(metric) is not None:
+                backend.setdefault(metric, []).append(result[metric])
+    for backend in summary.values():
+        for metric, values in backend.items():
+            backend[metric] = sum(values) / float(len(values))
+    return summary
+
+
+# Returns a list of regressions against the baseline
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        for metric in METRICS:
+            old, new = baseline[name].get(metric), result.get(metric)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append("%s: %s %.1f -> %.1f" % (name, metric, old, new))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description="Xvfb benchmarks for classification-banner")
+    parser.add_argument("--display", default=":98",
+                        help="Display number used for Xvfb")
+    parser.add_argument("--output", metavar="FILE",
+                        help="Write the results as JSON")
+    parser.add_argument("--baseline", default=BASELINE, metavar="FILE",
+                        help="Baseline to compare against")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown/growth relative to the baseline")
+    parser.add_argument("--settle", type=float, default=0.5,
+                        help="Seconds to wait after the first map before measuring memory")
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help="Comma-separated backends to measure")
+    parser.add_argument("--summary", action="store_true",
+                        help="Print the mean of every metric per backend")
+    options = parser.parse_args()
+
+    # An empty configuration so that /etc/classification-banner does not
+    # influence the results
+    config = tempfile.NamedTemporaryFile(mode="w", suffix=".conf")
+
+    results = {}
+    for monitors in MONITORS:
+        xvfb = Xvfb(options.display, monitors)
+        try:
+            for backend in options.backends.split(","):
+                for values in itertools.product([False, True], repeat=len(FLAGS)):
+                    case = dict(zip([name for name, flag in FLAGS], values))
+                    case["monitors"] = monitors
+                    case["backend"] = backend
+                    name = case_name(case)
+                    results[name] = run_case(xvfb, case, config.name, options.settle)
+                    results[name]["case"] = case
+                    print("%-82s start %7.1f ms  rss %7d KiB  relayout %s" % (
+                        name, results[name]["cold_start_ms"], results[name]["rss_kib"],
+                        "%.1f ms" % results[name]["relayout_ms"]
+                        if results[name]["relayout_ms"] is not None else "-"))
+        finally:
+            xvfb.stop()
+
+    if options.summary:
+        for backend, means in sorted(summarize(results).items()):
+            print("%-6s %s" % (backend, "  ".join("%s %.1f" % (metric, means[metric])
+                                                  for metric in METRICS if metric in means)))
+
+    if options.output:
+        with open(options.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if options.update_baseline:
+        with open(options.baseline, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        print("Baseline written to %s" % options.baseline)
+        return
+
+    if not os.path.exists(options.baseline):
+        print("No baseline at %s, run with --update-baseline to create one" % options.baseline)
+        return
+    with open(options.baseline) as stored:
+        regressions = compare(results, json.load(stored), options.tolerance)
+    for regression in regressions:
+        print("REGRESSION: %s" % regression)
+    if regressions:
+        sys.exit(1)
+    print("OK: no regressions against %s" % options.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+"""Hotplug soak test for the banner lifecycle.
+
+Runs a DisplayBanner against a virtual X server (Xvfb) and drives
+thousands of simulated monitor topology changes through it. RSS, the
+number of live Python objects, toplevel GTK windows and the objects
+owned by the display's lifecycle are sampled along the way; the run
+fails if any of them keeps growing once the warm-up period is over.
+
+    python benchmarks/soak.py --iterations 5000 -- --system-info
+"""
+
+import gc
+import os
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Simulated monitor layouts: laptop panel, docked, docked plus projector,
+# rotated external monitor, ...
+LAYOUTS = [
+    [(0, 0, 1366, 768)],
+    [(0, 0, 1920, 1080), (1920, 0, 1920, 1080)],
+    [(0, 0, 1920, 1080), (1920, 0, 1920, 1080), (3840, 0, 1024, 768)],
+    [(0, 0, 1366, 768), (1366, 0, 1080, 1920)],
+    [(0, 0, 2560, 1440)],
+    [(0, 0, 1920, 1200), (0, 1200, 1920, 1200)],
+]
+
+
+class FakeScreen:
+    """Stand-in for gtk.gdk.Screen whose monitor layout can be swapped."""
+
+    def __init__(self, monitors):
+        self.monitors = monitors
+
+    def get_n_monitors(self):
+        return len(self.monitors)
+
+    def get_monitor_geometry(self, i):
+        return self.monitors[i]
+
+    def get_primary_monitor(self):
+        return 0
+
+    def get_width(self):
+        return max(x + w for x, y, w, h in self.monitors)
+
+    def get_height(self):
+        return max(y + h for x, y, w, h in self.monitors)
+
+
+# Returns the resident set size of this process in bytes
+def rss():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def start_xvfb(display):
+    xvfb = subprocess.Popen(["Xvfb", display, "-screen", "0", "4096x2160x24",
+                             "+extension", "RANDR", "-nolisten", "tcp"])
+    # Wait for the server socket to show up
+    socket = "/tmp/.X11-unix/X%s" % display.lstrip(":")
+    for i in range(100):
+        if os.path.exists(socket):
+            break
+        time.sleep(0.05)
+    return xvfb
+
+
+def main():
+    parser = ArgumentParser(description="Hotplug soak test for classification-banner")
+    parser.add_argument("--iterations", type=int, default=5000,
+                        help="Number of simulated topology changes")
+    parser.add_argument("--samples", type=int, default=20,
+                        help="Number of measurements taken during the run")
+    parser.add_argument("--warmup", type=float, default=0.1,
+                        help="Fraction of the run ignored while caches fill up")
+    parser.add_argument("--rss-slack", type=int, default=2048,
+                        help="Allowed RSS growth after warm-up, in KiB")
+    parser.add_argument("--object-slack", type=int, default=500,
+                        help="Allowed growth in live Python objects after warm-up")
+    parser.add_argument("--display", default=":99",
+                        help="Display number used for Xvfb")
+    parser.add_argument("--no-xvfb", action="store_true",
+                        help="Use the current DISPLAY instead of starting Xvfb")
+    parser.add_argument("banner_args", nargs="*",
+                        help="Options passed on to classification-banner")
+    options = parser.parse_args()
+
+    xvfb = None
+    if not options.no_xvfb:
+        xvfb = start_xvfb(options.display)
+        os.environ["DISPLAY"] = options.display
+
+    # The banner reads its options from the command line
+    sys.argv = ["classification-banner"] + options.banner_args
+
+    try:
+        import gtk
+        from classification_banner import banner
+        from classification_banner.config import Configuration
+        from classification_banner.geometry import MonitorGeometry
+
+        screen = FakeScreen(LAYOUTS[0])
+        display = banner.DisplayBanner(banner.GtkBackend(), Configuration())
+        display.backend.geometry = MonitorGeometry(screen)
+        display.relayout()
+
+        interval = max(1, options.iterations // options.samples)
+        samples = []
+        for i in range(options.iterations):
+            screen.monitors = LAYOUTS[i % len(LAYOUTS)]
+            display.relayout()
+            while gtk.events_pending():
+                gtk.main_iteration(False)
+
+            if i % interval == interval - 1:
+                gc.collect()
+                windows = sum(len(w) for w in display.banner_windows.values())
+                samples.append({
+                    "iteration": i + 1,
+                    "rss": rss(),
+                    "objects": len(gc.get_objects()),
+                    "toplevels": len(gtk.window_list_toplevels()),
+                    "windows": windows,
+                    "lifecycle": len([child for child in display.lifecycle.children
+                                      if isinstance(child, banner.ClassificationBanner)]),
+                })
+                print("%(iteration)8d  rss %(rss)10d  objects %(objects)8d  "
+                      "toplevels %(toplevels)4d  windows %(windows)3d  "
+                      "lifecycle %(lifecycle)3d" % samples[-1])
+
+        display.close()
+        while gtk.events_pending():
+            gtk.main_iteration(False)
+        leftover = len(gtk.window_list_toplevels())
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+            xvfb.wait()
+
+    steady = samples[int(len(samples) * options.warmup):]
+    failures = []
+    rss_growth = (steady[-1]["rss"] - steady[0]["rss"]) // 1024
+    if rss_growth > options.rss_slack:
+        failures.append("RSS grew by %d KiB" % rss_growth)
+    object_growth = steady[-1]["objects"] - steady[0]["objects"]
+    if object_growth > options.object_slack:
+        failures.append("live objects grew by %d" % object_growth)
+    for sample in steady:
+        if sample["toplevels"] != sample["windows"] or sample["lifecycle"] != sample["windows"]:
+            failures.append("window accounting is off at iteration %d" % sample["iteration"])
+    if leftover:
+        failures.append("%d toplevel windows left after close()" % leftover)
+
+    for failure in failures:
+        print("FAIL: %s" % failure)
+    if failures:
+        sys.exit(1)
+    print("OK: %d topology changes" % options.iterations)
+
+
+if __name__ == "__main__":
+    main()
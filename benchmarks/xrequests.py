@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+"""Count the X requests and round trips it takes to bring the banners up.
+
+A classification-banner process is pointed at a small proxy display that
+forwards to Xvfb and decodes both directions of the X protocol. It
+counts every request the banner sends and every reply it has to wait
+for until the first banner is mapped and the rest have settled. Replies
+are an upper bound on the round trips, because a client may pipeline
+several requests before it waits for their replies.
+
+Windows are created in one batch, so adding a monitor (two more banner
+windows) must not add more than EXPECTED_REPLIES round trips per
+window. Creating and mapping the windows one at a time, waiting for
+each, costs several round trips per window and fails the check. The
+script exits with status 1 when it does.
+
+    python benchmarks/xrequests.py
+    python benchmarks/xrequests.py --max-replies 150 --backends gtk
+"""
+
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+
+from bench_xvfb import Banner, Xvfb
+
+X11_SOCKET_DIR = "/tmp/.X11-unix"
+
+# Core requests worth naming in the report
+OPCODES = {
+    1: "CreateWindow", 2: "ChangeWindowAttributes", 3: "GetWindowAttributes",
+    8: "MapWindow", 10: "UnmapWindow", 12: "ConfigureWindow", 14: "GetGeometry",
+    16: "InternAtom", 17: "GetAtomName", 18: "ChangeProperty", 20: "GetProperty",
+    38: "QueryPointer", 43: "GetInputFocus", 45: "OpenFont", 47: "QueryFont",
+    48: "QueryTextExtents", 49: "ListFonts", 53: "CreatePixmap", 55: "CreateGC",
+    59: "SetClipRectangles", 62: "CopyArea", 70: "PolyFillRectangle", 72: "PutImage",
+    74: "PolyText8", 85: "AllocNamedColor", 98: "QueryExtension",
+}
+
+# Replies each additional banner window may cost at most, per backend.
+# Everything a banner waits for once (atoms, fonts, colors, the
+# extensions) is paid by the first monitor.
+EXPECTED_REPLIES = {"gtk": 3, "xlib": 1}
+
+
+class Counters:
+    """Requests and replies seen on the proxied connections."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.replies = 0
+            self.opcodes = {}
+
+    def request(self, opcode):
+        with self.lock:
+            self.requests += 1
+            self.opcodes[opcode] = self.opcodes.get(opcode, 0) + 1
+
+    def reply(self):
+        with self.lock:
+            self.replies += 1
+
+    def snapshot(self):
+        with self.lock:
+            top = sorted(self.opcodes.items(), key=lambda item: -item[1])[:8]
+            return {
+                "requests": self.requests,
+                "replies": self.replies,
+                "top_requests": dict((OPCODES.get(opcode, "opcode %d" % opcode), count)
+                                     for opcode, count in top),
+            }
+
+
+class Stream:
+    """Splits one direction of an X connection into messages."""
+
+    def __init__(self, counters, client):
+        self.counters = counters
+        self.client = client
+        self.data = b""
+        self.order = None
+        self.setup = True
+
+    def feed(self, chunk, order=None):
+        self.data += chunk
+        if order is not None:
+            self.order = order
+        while True:
+            size = self.message_size()
+            if size is None or len(self.data) < size:
+                return
+            message, self.data = self.data[:size], self.data[size:]
+            self.count(message)
+
+    def unpack(self, fmt, offset):
+        return struct.unpack_from(self.order + fmt, self.data, offset)[0]
+
+    # Returns the size of the next message, or None if it is not known yet
+    def message_size(self):
+        if self.client:
+            if self.setup:
+                if len(self.data) < 12:
+                    return None
+                self.order = "<" if self.data[0:1] == b"l" else ">"
+                name, data = self.unpack("H", 6), self.unpack("H", 8)
+                return 12 + pad(name) + pad(data)
+            if len(self.data) < 4:
+                return None
+            length = self.unpack("H", 2)
+            if length == 0:
+                # BIG-REQUESTS
+                if len(self.data) < 8:
+                    return None
+                length = self.unpack("I", 4)
+            return 4 * length
+        if self.order is None:
+            return None
+        if self.setup:
+            if len(self.data) < 8:
+                return None
+            return 8 + 4 * self.unpack("H", 6)
+        if len(self.data) < 32:
+            return None
+        kind = ord(self.data[0:1]) & 0x7f
+        if kind == 1 or kind == 35:
+            # Replies and generic events carry extra data
+            return 32 + 4 * self.unpack("I", 4)
+        return 32
+
+    def count(self, message):
+        if self.setup:
+            self.setup = False
+            return
+        if self.client:
+            self.counters.request(ord(message[0:1]))
+        elif ord(message[0:1]) == 1:
+            self.counters.reply()
+
+
+def pad(n):
+    return (n + 3) & ~3
+
+
+class Proxy:
+    """A display that forwards to another one and counts the traffic."""
+
+    def __init__(self, display, target, counters):
+        self.path = os.path.join(X11_SOCKET_DIR, "X%s" % display.lstrip(":"))
+        self.target = os.path.join(X11_SOCKET_DIR, "X%s" % target.lstrip(":"))
+        self.counters = counters
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.bind(self.path)
+        self.socket.listen(5)
+        thread = threading.Thread(target=self.accept)
+        thread.daemon = True
+        thread.start()
+
+    def accept(self):
+        while True:
+            try:
+                client, address = self.socket.accept()
+            except socket.error:
+                return
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.connect(self.target)
+            requests = Stream(self.counters, client=True)
+            replies = Stream(self.counters, client=False)
+            for source, sink, stream in [(client, server, requests), (server, client, replies)]:
+                thread = threading.Thread(target=self.pump,
+                                          args=(source, sink, stream, requests))
+                thread.daemon = True
+                thread.start()
+
+    def pump(self, source, sink, stream, requests):
+        while True:
+            try:
+                chunk = source.recv(65536)
+            except socket.error:
+                chunk = b""
+            if not chunk:
+                try:
+                    sink.shutdown(socket.SHUT_WR)
+                except socket.error:
+                    pass
+                return
+            # The server side only knows the byte order from the client
+            stream.feed(chunk, None if stream is requests else requests.order)
+            sink.sendall(chunk)
+
+    def close(self):
+        self.socket.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def main():
+    parser = ArgumentParser(description="Count X requests of classification-banner start-up")
+    parser.add_argument("--display", default=":96",
+                        help="Display number used for Xvfb")
+    parser.add_argument("--proxy", default=":95",
+                        help="Display number of the counting proxy")
+    parser.add_argument("--monitors", default="1,2,3",
+                        help="Comma-separated monitor counts to run")
+    parser.add_argument("--backends", default="gtk,xlib",
+                        help="Comma-separated backends to run")
+    parser.add_argument("--settle", type=float, default=1.0,
+                        help="Seconds to wait after the first map for the other banners")
+    parser.add_argument("--max-requests", type=int,
+                        help="Fail if any run sends more requests")
+    parser.add_argument("--max-replies", type=int,
+                        help="Fail if any run waits for more replies")
+    parser.add_argument("--max-replies-per-window", type=float,
+                        help="Replies an additional window may cost (default per backend: %s)" %
+                        ", ".join("%s %d" % item for item in sorted(EXPECTED_REPLIES.items())))
+    parser.add_argument("--output", metavar="FILE",
+                        help="Write the results as JSON")
+    parser.add_argument("banner_args", nargs="*",
+                        help="Options passed on to classification-banner")
+    options = parser.parse_args()
+
+    # An empty configuration so that /etc/classification-banner does not
+    # influence the results
+    config = tempfile.NamedTemporaryFile(mode="w", suffix=".conf")
+
+    results = {}
+    runs = {}
+    failures = []
+    for monitors in [int(m) for m in options.monitors.split(",")]:
+        xvfb = Xvfb(options.display, monitors)
+        counters = Counters()
+        proxy = Proxy(options.proxy, options.display, counters)
+        try:
+            for backend in options.backends.split(","):
+                counters.reset()
+                banner = Banner(options.proxy, ["--startup-trace", "--new-instance",
+                                                "--config", config.name,
+                                                "--backend", backend] + options.banner_args)
+                try:
+                    banner.wait_for("total")
+                    time.sleep(options.settle)
+                finally:
+                    banner.stop()
+                result = counters.snapshot()
+                result["windows"] = 2 * monitors
+                name = "%s,monitors=%d" % (backend, monitors)
+                results[name] = result
+                runs.setdefault(backend, []).append((monitors, result))
+                print("%-20s requests %6d  replies %5d  per window %6.1f / %5.1f" % (
+                    name, result["requests"], result["replies"],
+                    result["requests"] / float(result["windows"]),
+                    result["replies"] / float(result["windows"])))
+                if options.max_requests is not None and result["requests"] > options.max_requests:
+                    failures.append("%s: %d requests" % (name, result["requests"]))
+                if options.max_replies is not None and result["replies"] > options.max_replies:
+                    failures.append("%s: %d replies" % (name, result["replies"]))
+        finally:
+            proxy.close()
+            xvfb.stop()
+
+    # The round trips an additional window costs, between consecutive
+    # monitor counts
+    for backend, measured in sorted(runs.items()):
+        limit = options.max_replies_per_window
+        if limit is None:
+            limit = EXPECTED_REPLIES.get(backend)
+        measured.sort(key=lambda run: run[0])
+        for (fewer, small), (more, large) in zip(measured, measured[1:]):
+            windows = large["windows"] - small["windows"]
+            if windows <= 0:
+                continue
+            cost = (large["replies"] - small["replies"]) / float(windows)
+            print("%-20s %5.1f replies per additional window (limit %s)" % (
+                "%s,%d->%d" % (backend, fewer, more), cost, limit))
+            if limit is not None and cost > limit:
+                failures.append("%s: %d -> %d monitors costs %.1f replies per window, expected at most %s" %
+                                (backend, fewer, more, cost, limit))
+
+    if options.output:
+        with open(options.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    for failure in failures:
+        print("FAIL: %s" % failure)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
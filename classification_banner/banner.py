@@ -4,10 +4,11 @@
 
 import sys
 import os
-from argparse import ArgumentParser, RawDescriptionHelpFormatter
-from tempfile import TemporaryFile
 import time
-from socket import gethostname
+
+# Start-up phases are timed from here unless the caller started the
+# clock earlier, see StartupTrace
+START_TIME = time.time()
 
 # Python version check
 # Check the version by comparing sys.hexversion to the desired version
@@ -15,16 +16,15 @@ from socket import gethostname
 # or
 # `if sys.hexversion >= 0x03000000:`
 
-from ConfigParser import ConfigParser, MissingSectionHeaderError, DEFAULTSECT
-
-# Global Configuration File
-CONF_FILE = "/etc/classification-banner"
+from classification_banner.config import Configuration
 
 # Check if DISPLAY variable is set
 try:
     os.environ["DISPLAY"]
     import pygtk
     import gtk
+    import gobject
+    import cairo
 except:
     try:
         import Gtk
@@ -33,32 +33,36 @@ except:
 #       sys.exit(1)
         quit()
 
-# Returns Username
-def get_user():
-    try:
-        user = os.getlogin()
-    except:
-        user = ''
-        pass
-    return user
+from classification_banner import instance, mainloop
+from classification_banner.display import DisplayBanner, serve
+from classification_banner.geometry import MonitorGeometry
+from classification_banner.lifecycle import Lifecycle
+from classification_banner.sysinfo import live_info
+from classification_banner.tracing import StartupTrace, span, traced
 
 
-# Returns Hostname
-def get_host():
-    host = gethostname()
-    host = host.split('.')[0]
-    return host
+# Returns an error message if an update holds a color GTK cannot parse
+def color_error(values):
+    for key in ("fgcolor", "bgcolor"):
+        if key in values:
+            try:
+                gtk.gdk.color_parse(values[key])
+            except ValueError:
+                return "%s: unknown color %r" % (key, values[key])
+    return None
 
 
 # Classification Banner Class
 class ClassificationBanner:
     """Class to create and refresh the actual banner."""
 
+    @traced("ClassificationBanner.__init__")
     def __init__(self, message="UNCLASSIFIED", fgcolor="#000000",
                  bgcolor="#00CC00", face="liberation-sans", size="small",
                  weight="bold", x=0, y=0, esc=True, opacity=0.75,
                  sys_info=False, taskbar_offset=0, banner_width=0, 
-                 click_to_move=False):
+                 click_to_move=False, renderer="widgets", screen=None,
+                 info_left="{host}", info_right="{user}", position=None, show=True):
 
         """Set up and display the main window
 
@@ -75,26 +79,35 @@ class ClassificationBanner:
         taskbar_offset -- The size of the taskbar in pixels to prevent overlapping on multi-monitor setups
         banner_width   -- The width of the banner in pixels. 0 is full-screen
         click_to_move  -- Enables left-click to move between top and bottom and right-click to move left or right
+        renderer       -- "widgets" (boxes and labels) or "surface" (one cached, pre-rendered image)
+        screen         -- gtk.gdk.Screen to create the window on (default screen)
+        info_left      -- System info template shown on the left, e.g. "{host} {ip}"
+        info_right     -- System info template shown on the right, e.g. "{user} {clock}"
+        position       -- (x, y) to create the window at (centered by default)
+        show           -- Map the window right away; otherwise it is created unmapped and shown by the caller
         """
         self.hres = x
         self.vres = y
-
-        # Dynamic Resolution Scaling
-        self.monitor = gtk.gdk.Screen()
-        self.monitor.connect("size-changed", self.resize)
-
-        # Newer versions of pygtk have this method
-        try:
-            self.monitor.connect("monitors-changed", self.resize)
-        except:
-            pass
+        self.info_source = None
+        self.hidden = False
+        self.struts = None
+        # Called with the banner when ESC is pressed, see DisplayBanner.escape
+        self.escape = None
+        self.map_handler = None
+        self.lifecycle = Lifecycle()
+        self.face = face
+        self.weight = weight
+        self.size = size
+        self.fgcolor = fgcolor
 
         # Create Main Window
         self.window = gtk.Window()
+        if screen is not None:
+            self.window.set_screen(screen)
         self.window.set_position(gtk.WIN_POS_CENTER)
-        self.window.connect("hide", self.restore)
+        self.lifecycle.connect(self.window, "hide", self.restore)
         if esc:
-            self.window.connect("key-press-event", self.keypress)
+            self.lifecycle.connect(self.window, "key-press-event", self.keypress)
         self.window.modify_bg(gtk.STATE_NORMAL, gtk.gdk.color_parse(bgcolor))
         self.window.set_property('skip-taskbar-hint', True)
         self.window.set_property('skip-pager-hint', True)
@@ -102,12 +115,16 @@ class ClassificationBanner:
         self.window.stick()
         self.window.set_decorated(False)
         self.window.set_keep_above(True)
-        self.window.set_app_paintable(True)
 
-        try:
-            self.window.set_opacity(opacity)
-        except:
-            pass
+        # Fully opaque banners skip translucency altogether, and tell the
+        # compositor it need not draw what is underneath them
+        self.opaque = opacity >= 1
+        if not self.opaque:
+            self.window.set_app_paintable(True)
+            try:
+                self.window.set_opacity(opacity)
+            except:
+                pass
 
         # Set the default window size, full-screen unless banner_width is set.
         if (banner_width <= 0):
@@ -115,113 +132,304 @@ class ClassificationBanner:
         else:
             self.window.set_default_size(banner_width, 5)
 
+        self.message = message
+        self.bgcolor = bgcolor
+        self.opacity = opacity
+        self.esc = esc
+        self.sys_info = sys_info
+        self.info_templates = (info_left, info_right)
+        self.info_texts = None
+        if sys_info:
+            live_info.subscribe(self.show_info, self.info_templates)
+        if renderer == "surface":
+            # Draw the whole banner from one shared, pre-rendered surface.
+            # Imported here so that the widget renderer does not pay for it.
+            from classification_banner.render import text_surfaces
+            self.text_surfaces = text_surfaces
+            self.center_label = self.host_label = self.user_label = self.esc_label = None
+            self.area = gtk.DrawingArea()
+            self.lifecycle.connect(self.area, "expose-event", self.expose)
+            width = int(self.hres) if banner_width <= 0 else banner_width
+            self.area.set_size_request(-1, self.surface(width).get_height())
+            content = self.area
+        else:
+            self.area = None
+            self.build_widgets(message, esc, sys_info)
+            content = self.hbox
+
+        # Setup an EventBox to receive click events if click-to-move is enabled
+        if click_to_move:
+            # Create the EventBox to receive click input
+            self.eventbox = gtk.EventBox()
+            self.lifecycle.connect(self.eventbox, "button_press_event", self.mouseclick)
+            self.eventbox.add(content)
+            self.eventbox.modify_bg(gtk.STATE_NORMAL, gtk.gdk.color_parse(bgcolor))
+            self.window.add(self.eventbox)
+            # Create state variable
+            self.centerStatus = "center"
+        else:
+            self.window.add(content)
+
+        # Create the X window at its final position and size, so that it
+        # never shows up centered first, and only map it when asked to
+        if position is not None:
+            self.window.set_position(gtk.WIN_POS_NONE)
+            with span("move"):
+                self.window.move(*position)
+        with span("show_all"):
+            self.window.get_child().show_all()
+        self.width, self.height = self.window.get_size()
+        self.window.realize()
+        if self.opaque:
+            self.mark_opaque()
+        if show:
+            self.window.show()
+
+    # Create the boxes and labels of the widget renderer
+    def build_widgets(self, message, esc, sys_info):
         # Create Main Horizontal Box to Populate
         self.hbox = gtk.HBox()
 
         # Create the Center Vertical Box
         self.vbox_center = gtk.VBox()
-        self.center_label = gtk.Label(
-            "<span font_family='%s' weight='%s' foreground='%s' size='%s'>%s</span>" %
-            (face, weight, fgcolor, size, message))
+        self.center_label = gtk.Label(self.markup(message))
         self.center_label.set_use_markup(True)
         self.center_label.set_justify(gtk.JUSTIFY_CENTER)
         self.vbox_center.pack_start(self.center_label, True, True, 0)
 
-        # Create the Right-Justified Vertical Box to Populate for hostname
-        self.vbox_right = gtk.VBox()
-        self.host_label = gtk.Label(
-            "<span font_family='%s' weight='%s' foreground='%s' size='%s'>%s</span>" %
-            (face, weight, fgcolor, size, get_host()))
-        self.host_label.set_use_markup(True)
-        self.host_label.set_justify(gtk.JUSTIFY_RIGHT)
-        self.host_label.set_width_chars(20)
-
-        # Create the Left-Justified Vertical Box to Populate for user
-        self.vbox_left = gtk.VBox()
-        self.user_label = gtk.Label(
-            "<span font_family='%s' weight='%s' foreground='%s' size='%s'>%s</span>" %
-            (face, weight, fgcolor, size, get_user()))
-        self.user_label.set_use_markup(True)
-        self.user_label.set_justify(gtk.JUSTIFY_LEFT)
-        self.user_label.set_width_chars(20)
-
-        # Create the Right-Justified Vertical Box to Populate for ESC message
-        self.vbox_esc_right = gtk.VBox()
-        self.esc_label = gtk.Label(
-            "<span font_family='liberation-sans' weight='normal' foreground='%s' size='xx-small'>  (ESC to hide temporarily)  </span>" %
-            (fgcolor))
-        self.esc_label.set_use_markup(True)
-        self.esc_label.set_justify(gtk.JUSTIFY_RIGHT)
-        self.esc_label.set_width_chars(20)
-
-        # Empty Label for formatting purposes
-        self.vbox_empty = gtk.VBox()
-        self.empty_label = gtk.Label(
-            "<span font_family='liberation-sans' weight='normal'>                 </span>")
-        self.empty_label.set_use_markup(True)
-        self.empty_label.set_width_chars(20)
-
-        if not esc and not sys_info:
-            self.hbox.pack_start(self.vbox_center, True, True, 0)
-        elif not esc and sys_info:
+        # Only the labels that are shown get created
+        self.host_label = None
+        self.user_label = None
+        self.esc_label = None
+
+        if sys_info:
+            # Create the Right-Justified Vertical Box to Populate for hostname
+            self.vbox_right = gtk.VBox()
+            self.host_label = gtk.Label()
+            self.host_label.set_justify(gtk.JUSTIFY_RIGHT)
+            self.host_label.set_width_chars(20)
+
+            # Create the Left-Justified Vertical Box to Populate for user
+            self.vbox_left = gtk.VBox()
+            self.user_label = gtk.Label()
+            self.user_label.set_justify(gtk.JUSTIFY_LEFT)
+            self.user_label.set_width_chars(20)
+
+            # The system info is filled in after the first paint
+            self.info_source = mainloop.get().idle_add(self.system_info)
+
             self.vbox_right.pack_start(self.host_label, True, True, 0)
             self.vbox_left.pack_start(self.user_label, True, True, 0)
             self.hbox.pack_start(self.vbox_right, False, True, 20)
             self.hbox.pack_start(self.vbox_center, True, True, 0)
             self.hbox.pack_start(self.vbox_left, False, True, 20)
-        elif esc and not sys_info:
+        elif esc:
+            # Create the Right-Justified Vertical Box to Populate for ESC message
+            self.vbox_esc_right = gtk.VBox()
+            self.esc_label = gtk.Label(self.esc_markup())
+            self.esc_label.set_use_markup(True)
+            self.esc_label.set_justify(gtk.JUSTIFY_RIGHT)
+            self.esc_label.set_width_chars(20)
+
+            # Empty Label for formatting purposes
+            self.vbox_empty = gtk.VBox()
+            self.empty_label = gtk.Label(
+                "<span font_family='liberation-sans' weight='normal'>                 </span>")
+            self.empty_label.set_use_markup(True)
+            self.empty_label.set_width_chars(20)
             self.empty_label.set_justify(gtk.JUSTIFY_LEFT)
+
             self.vbox_empty.pack_start(self.empty_label, True, True, 0)
             self.vbox_esc_right.pack_start(self.esc_label, True, True, 0)
             self.hbox.pack_start(self.vbox_esc_right, False, True, 0)
             self.hbox.pack_start(self.vbox_center, True, True, 0)
             self.hbox.pack_start(self.vbox_empty, False, True, 0)
-        elif esc and sys_info:
-            self.vbox_right.pack_start(self.host_label, True, True, 0)
-            self.vbox_left.pack_start(self.user_label, True, True, 0)
-            self.hbox.pack_start(self.vbox_right, False, True, 20)
+        else:
             self.hbox.pack_start(self.vbox_center, True, True, 0)
-            self.hbox.pack_start(self.vbox_left, False, True, 20)
 
-        # Setup an EventBox to receive click events if click-to-move is enabled
-        if click_to_move:
-            # Create the EventBox to receive click input
-            self.eventbox = gtk.EventBox()
-            self.eventbox.connect("button_press_event", self.mouseclick)
-            self.eventbox.add(self.hbox)
-            self.eventbox.modify_bg(gtk.STATE_NORMAL, gtk.gdk.color_parse(bgcolor))
-            self.window.add(self.eventbox)
-            # Create state variable
-            self.centerStatus = "center"
-        else:
-            self.window.add(self.hbox)
+    # Returns the (markup, alignment) pairs drawn by the surface renderer
+    def texts(self):
+        texts = [(self.markup(self.message), "center")]
+        if self.sys_info:
+            if self.info_texts is None:
+                self.info_texts = tuple(live_info.get(self.info_templates))
+            texts.append((self.markup(self.info_texts[0]), "left"))
+            texts.append((self.markup(self.info_texts[1]), "right"))
+        elif self.esc:
+            texts.append((self.esc_markup(), "left"))
+        return tuple(texts)
+
+    def surface(self, width):
+        return self.text_surfaces.get(self.texts(), self.fgcolor, self.bgcolor,
+                                      self.face, self.size, self.weight, width)
+
+    # Paint the damaged part of the banner from the cached surface
+    def expose(self, widget, event):
+        context = widget.window.cairo_create()
+        context.rectangle(event.area.x, event.area.y, event.area.width, event.area.height)
+        context.clip()
+        context.set_source_surface(self.surface(widget.allocation.width), 0, 0)
+        context.paint()
+        return True
 
-        self.window.show_all()
-        self.width, self.height = self.window.get_size()
+    # Returns the Pango markup for a label of the banner
+    def markup(self, text):
+        return ("<span font_family='%s' weight='%s' foreground='%s' size='%s'>%s</span>" %
+                (self.face, self.weight, self.fgcolor, self.size, text))
+
+    def esc_markup(self):
+        return ("<span font_family='liberation-sans' weight='normal' foreground='%s' size='xx-small'>  (ESC to hide temporarily)  </span>" %
+                (self.fgcolor))
+
+    # Fill in the system info labels
+    def system_info(self):
+        self.info_source = None
+        self.info_texts = None
+        self.show_info(*live_info.get(self.info_templates))
+        return False
+
+    # Update the system info text that changed (called by live_info)
+    def show_info(self, left, right):
+        old, self.info_texts = self.info_texts, (left, right)
+        if self.area is not None:
+            if self.info_texts != old:
+                self.area.queue_draw()
+            return
+        if old is None or left != old[0]:
+            self.host_label.set_markup(self.markup(left))
+        if old is None or right != old[1]:
+            self.user_label.set_markup(self.markup(right))
+
+    # Change the text, font and colors of the banner in place
+    # Only the parts of the banner that depend on a changed option are touched
+    def restyle(self, message, fgcolor, bgcolor, face, size, weight, opacity):
+        refont = (fgcolor, face, size, weight) != (self.fgcolor, self.face, self.size, self.weight)
+        retext = refont or message != self.message
+        recolor = bgcolor != self.bgcolor
+        self.face = face
+        self.weight = weight
+        self.size = size
+        self.fgcolor = fgcolor
+        self.message = message
+        self.bgcolor = bgcolor
+
+        if recolor:
+            self.window.modify_bg(gtk.STATE_NORMAL, gtk.gdk.color_parse(bgcolor))
+            if hasattr(self, "eventbox"):
+                self.eventbox.modify_bg(gtk.STATE_NORMAL, gtk.gdk.color_parse(bgcolor))
+        if self.area is not None:
+            if retext or recolor:
+                self.area.set_size_request(-1, self.surface(self.width).get_height())
+                self.area.queue_draw()
+        else:
+            if retext:
+                self.center_label.set_markup(self.markup(message))
+            if refont:
+                if self.host_label is not None and self.info_source is None:
+                    self.system_info()
+                if self.esc_label is not None:
+                    self.esc_label.set_markup(self.esc_markup())
+        if retext:
+            # A new font can change the height, see DisplayBanner.apply
+            self.height = self.window.get_child().size_request()[1]
+            self.window.resize(self.width, self.height)
+
+        if opacity != self.opacity:
+            self.opacity = opacity
+            self.opaque = opacity >= 1
+            self.window.set_app_paintable(not self.opaque)
+            try:
+                self.window.set_opacity(opacity)
+            except:
+                pass
+            if self.opaque:
+                self.mark_opaque()
+            else:
+                self.window.window.property_delete("_NET_WM_OPAQUE_REGION")
+
+    # Tell the compositor that the whole window is opaque
+    def mark_opaque(self):
+        self.window.window.property_change("_NET_WM_OPAQUE_REGION", "CARDINAL", 32,
+                                           gtk.gdk.PROP_MODE_REPLACE,
+                                           [0, 0, self.width, self.height])
+
+    # Keep other windows from being placed underneath the banner. `values`
+    # are the _NET_WM_STRUT_PARTIAL values (see layout.strut); None takes
+    # back the space of a banner that is no longer on an outer edge.
+    def reserve(self, values):
+        if values == self.struts:
+            return
+        self.struts = values
+        window = self.window.window
+        if values is None:
+            window.property_delete("_NET_WM_STRUT_PARTIAL")
+            window.property_delete("_NET_WM_STRUT")
+            return
+        window.property_change("_NET_WM_STRUT_PARTIAL", "CARDINAL", 32,
+                               gtk.gdk.PROP_MODE_REPLACE, values)
+        # Window managers that predate the partial strut
+        window.property_change("_NET_WM_STRUT", "CARDINAL", 32,
+                               gtk.gdk.PROP_MODE_REPLACE, values[:4])
 
     # Restore Minimized Window
     def restore(self, widget, data=None):
+        # Hidden on purpose, with ESC or while the session is locked
+        if self.hidden:
+            return True
         self.window.deiconify()
         self.window.present()
         return True
 
-    # Destroy Classification Banner Window on Resize (Display Banner Will Relaunch)
-    def resize(self, widget, data=None):
-        self.window.destroy()
-        return True
+    # Move and Resize the Window in Place (Display Banner Relayout)
+    @traced("place")
+    def place(self, x, y, width):
+        with span("move"):
+            self.window.move(x, y)
+        self.window.resize(width, self.height)
+        if self.opaque and width != self.width:
+            self.width = width
+            self.mark_opaque()
+        self.width = width
+        if hasattr(self, "centerStatus"):
+            self.centerStatus = "center"
 
     # Press ESC to hide window for 15 seconds
     def keypress(self, widget, event=None):
-        if event.keyval == 65307:
-            if not gtk.events_pending():
-                self.window.iconify()
-                self.window.hide()
-                time.sleep(15)
-                self.window.show()
-                self.window.deiconify()
-                self.window.present()
+        if event.keyval == 65307 and self.escape is not None:
+            self.escape(self)
         return True
 
+    def show(self):
+        self.hidden = False
+        self.window.show()
+        self.window.deiconify()
+        self.window.present()
+
+    def hide(self):
+        self.hidden = True
+        self.window.iconify()
+        self.window.hide()
+
+    # Call `callback()` once the window is on screen
+    def notify_mapped(self, callback):
+        self.map_handler = self.window.connect("map-event", self.mapped, callback)
+
+    def mapped(self, widget, event, callback):
+        self.window.disconnect(self.map_handler)
+        self.map_handler = None
+        callback()
+        return False
+
+    # Destroy the window along with its signal handlers
+    def destroy(self):
+        if self.info_source is not None:
+            mainloop.get().source_remove(self.info_source)
+            self.info_source = None
+        if self.sys_info:
+            live_info.unsubscribe(self.show_info)
+        self.lifecycle.close()
+        self.window.destroy()
+
     def mouseclick(self, widget, event=None):
         x, y = self.window.get_position()
         if event.button == 1:
@@ -235,260 +443,238 @@ class ClassificationBanner:
                 self.window.move(x - 300, y)
                 self.centerStatus = "center"
 
-class DisplayBanner:
+class WatermarkBanner:
+    """Faint classification text across a whole monitor.
 
-    """Display Classification Banner Message"""
-    def __init__(self):
-        # Dynamic Resolution Scaling
-        self.monitor = gtk.gdk.Screen()
-        self.monitor.connect("size-changed", self.resize)
+    The window takes no input at all: its input shape is empty, so the
+    pointer and the keyboard go to the windows underneath without the X
+    server ever sending us an event. Only the damaged parts are painted,
+    from a pattern shared by every watermark window. Without a compositing
+    manager the window cannot be translucent; it is then shaped to an
+    ordered dither of the text, keeping about `opacity` of its pixels, so
+    that it stays faint and does not hide what is underneath.
+    """
 
-        # Newer versions of pygtk have this method
-        try:
-            self.monitor.connect("monitors-changed", self.resize)
-        except:
-            pass
+    @traced("WatermarkBanner.__init__")
+    def __init__(self, message="UNCLASSIFIED", color="#007A33", face="liberation-sans",
+                 weight="bold", opacity=0.1, screen=None, area=(0, 0, 1, 1), show=True):
+        """Set up the watermark window
 
-        # Launch Banner
-        self.config = self.configure()
-        self.execute(self.config)
-
-    # Read configuration(s)
-    def configure(self):
-        defaults = {}
-        defaults["message"] = "UNCLASSIFIED"
-        defaults["fgcolor"] = "#FFFFFF"
-        defaults["bgcolor"] = "#007A33"
-        defaults["face"] = "liberation-sans"
-        defaults["size"] = "small"
-        defaults["weight"] = "bold"
-        defaults["show_top"] = True
-        defaults["show_bottom"] = True
-        defaults["hres"] = 0
-        defaults["vres"] = 0
-        defaults["sys_info"] = False
-        defaults["opacity"] = 0.75
-        defaults["esc"] = True
-        defaults["spanning"] = False
-        defaults["click_to_move"] = False
-        defaults["banner_width"] = 0
-        defaults["taskbar_offset"] = 0
-
-        # Check if a configuration file was passed in from the command line
-        default_heading = DEFAULTSECT
-        conf_parser = ArgumentParser(
-            formatter_class=RawDescriptionHelpFormatter,
-            add_help=False)
-        conf_parser.add_argument("-c", "--config",
-                                help="Specify the configuration file",
-                                metavar="FILE")
-        conf_parser.add_argument("--heading",
-                                help="Specify the config. section to use.",
-                                default=default_heading)
-        options, args = conf_parser.parse_known_args()
-
-        config_file = None
-        if options.config:
-            config_file = os.path.abspath(options.config)
-            if not os.path.isfile(config_file):
-                print("ERROR: Specified configuration file does not exist.")
-                sys.exit(1)
-        else:
-            config_file = os.path.abspath(CONF_FILE)
-            if not os.path.isfile(config_file):
-                config_file = None
-
-        # In order to maintain backwards compatibility with the way the
-        # previous configuration file format, a dummy section may need
-        # to be added to the configuration file.  If this is the case,
-        # a temporary file is used in order to avoid overwriting the
-        # user's configuration.
-        config = ConfigParser()
-
-        if config_file is not None:
-            fp = open(config_file, "r")
-            while True:
-                try:
-                    if sys.hexversion >= 0x03000000:
-                        config.read_file(fp, source=config_file)
-                    else:
-                        config.readfp(fp, config_file)
-                    break
-                except MissingSectionHeaderError:
-                    # Recreate the file, adding a default section.
-                    fp.close()
-                    fp = TemporaryFile()
-                    with open(config_file) as original:
-                        fp.write("[%s]\n" % default_heading + original.read())
-                    fp.seek(0)
-            fp.close()  # If this was a temporary file it will now be deleted.
-
-        # ConfigParser treats everything as strings and any quotation
-        # marks in a setting are explicitly added to the string.
-        # One way to fix this is to add everything to the defaults and
-        # then strip the quotation marks off of everything.
-        defaults.update(dict(config.items(options.heading)))
-        for key, val in defaults.items():
-            if config.has_option(options.heading, key):
-                defaults[key] = val.strip("\"'")
-        # TODO: This coercion section is hacky and should be fixed.
-        for key in ["show_top", "show_bottom", "sys_info", "esc", "spanning", "click_to_move"]:
-            if config.has_option(options.heading, key):
-                defaults[key] = config.getboolean(options.heading, key)
-        for key in ["hres", "vres", "taskbar_offset", "banner_width"]:
-            if config.has_option(options.heading, key):
-                defaults[key] = config.getint(options.heading, key)
-        for key in ["opacity"]:
-            if config.has_option(options.heading, key):
-                defaults[key] = config.getfloat(options.heading, key)
-
-        # Use the global config to set defaults for command line options
-        parser = ArgumentParser(parents=[conf_parser])
-        parser.add_argument("-m", "--message", default=defaults["message"],
-                          help="Set the Classification message")
-        parser.add_argument("-f", "--fgcolor", default=defaults["fgcolor"],
-                          help="Set the Foreground (text) color")
-        parser.add_argument("-b", "--bgcolor", default=defaults["bgcolor"],
-                          help="Set the Background color")
-        parser.add_argument("-x", "--hres", default=defaults["hres"], type=int,
-                          help="Set the Horizontal Screen Resolution")
-        parser.add_argument("-y", "--vres", default=defaults["vres"], type=int,
-                          help="Set the Vertical Screen Resolution")
-        parser.add_argument("-o", "--opacity", default=defaults["opacity"],
-                          type=float, dest="opacity",
-                          help="Set the window opacity for composted window managers")
-        parser.add_argument("--face", default=defaults["face"], help="Font face")
-        parser.add_argument("--size", default=defaults["size"], help="Font size")
-        parser.add_argument("--weight", default=defaults["weight"],
-                          help="Set the Font weight")
-        parser.add_argument("--disable-esc", default=defaults["esc"],
-                          dest="esc", action="store_false",
-                          help="Disable the 'ESC to hide' feature and don't show the banner message")
-        parser.add_argument("--hide-top", default=defaults["show_top"],
-                          dest="show_top", action="store_false",
-                          help="Disable the top banner")
-        parser.add_argument("--hide-bottom", default=defaults["show_bottom"],
-                          dest="show_bottom", action="store_false",
-                          help="Disable the bottom banner")
-        parser.add_argument("--system-info", default=defaults["sys_info"],
-                          dest="sys_info", action="store_true",
-                          help="Show user and hostname in the top banner")
-        parser.add_argument("--enable-spanning", default=defaults["spanning"],
-                          dest="spanning", action="store_true",
-                          help="Enable banner(s) to span across screens as a single banner")
-        parser.add_argument("--enable-click_to_move", default=defaults["click_to_move"],
-                          dest="click_to_move", action="store_true",
-                          help="Enable left-click to move the banner to the side to access UI elements that may be hidden.")
-        parser.add_argument("--banner_width", default=defaults["banner_width"],
-                          dest="banner_width", action="store_true",
-                          help="Set a width in pixels for the banner. 0 is full-screen")
-        parser.add_argument("--taskbar-offset", default=defaults["taskbar_offset"], type=int,
-                          help="Set the offset for the size of the task bar")   
-
-        options = parser.parse_args()
-        return options
-
-    # Launch the Classification Banner Window(s)
-    def execute(self, options):
-        self.num_monitor = self.monitor.get_n_monitors()
-
-        if options.hres == 0 or options.vres == 0:
-            # Try Xrandr to determine primary monitor resolution
-            try:
-                self.screen = os.popen("xrandr | grep ' connected ' | awk '{ print $3 }'").readlines()[0]
-                if ("+" in self.screen):
-                    # This means a multi-monitor setup. The GTK method fallback will properly handle this.
-                    raise Exception
-                self.x = self.screen.split('x')[0]
-                self.y = self.screen.split('x')[1].split('+')[0]
+        Keyword arguments:
+        message -- The classification level to display
+        color   -- Color of the text
+        face    -- Font face to use for the displayed text
+        weight  -- Bold or normal
+        opacity -- Opacity of the text (float) [0 .. 1, default 0.1]
+        screen  -- gtk.gdk.Screen to create the window on (default screen)
+        area    -- (x, y, width, height) of the monitor to cover
+        show    -- Map the window right away; otherwise it is created unmapped and shown by the caller
+        """
+        # Imported here so that banners without a watermark do not pay for it
+        from classification_banner.render import dither_pattern, watermark_tiles
+        self.tiles = watermark_tiles
+        self.dither = dither_pattern
+        self.lifecycle = Lifecycle()
+        self.message = message
+        self.color = color
+        self.face = face
+        self.weight = weight
+        self.opacity = opacity
+        self.x, self.y, self.width, self.height = area
 
-            except:
-                try:
-                    self.screen = os.popen("xrandr | grep ' current ' | awk '{ print $8$9$10+0 }'").readlines()[0]
-                    self.x = self.screen.split('x')[0]
-                    self.y = self.screen.split('x')[1].split('+')[0]
-
-                except:
-                    self.screen = os.popen("xrandr | grep '^\*0' | awk '{ print $2$3$4 }'").readlines()[0]
-                    self.x = self.screen.split('x')[0]
-                    self.y = self.screen.split('x')[1].split('+')[0]
-
-                else:
-                    # Fail back to GTK method
-                    self.display = gtk.gdk.display_get_default()
-                    self.screen = self.display.get_default_screen()
-                    self.x = self.screen.get_width()
-                    self.y = self.screen.get_height()
-        else:
-            # Resoultion Set Staticly
-            self.x = options.hres
-            self.y = options.vres
-
-        
-        if not options.spanning and self.num_monitor > 1:
-            # Get the geometry of the monitors. Subtract the user-defined taskbar_offset from the first monitor's self.x value
-            # Most Linux WMs report the entire size of the screen but don't mention the space that is always taken by the taskbar.
-            # If spanning is disabled, and both monitors have separate DisplayBanner instances, then the first monitor's banner will
-            # overlap into the second's, and if the user is using Gnome, they'll be at different heights, which is ugly. 
-            # TODO: If this is ever ported to Python 3, the GTK3 method get_monitor_workarea would be a much less hacky way of doing this.
-            for i in range(self.num_monitor):
-                mon_geo = self.screen.get_monitor_geometry(i)
-                self.x_location, self.y_location, self.x, self.y = mon_geo
-                if (i == 0):
-                    self.x -= options.taskbar_offset
-                self.banners(options)
+        self.window = gtk.Window()
+        if screen is not None:
+            self.window.set_screen(screen)
+        screen = self.window.get_screen()
+        colormap = screen.get_rgba_colormap()
+        self.translucent = colormap is not None and screen.is_composited()
+        if self.translucent:
+            self.window.set_colormap(colormap)
+        self.window.set_app_paintable(True)
+        self.window.set_property('skip-taskbar-hint', True)
+        self.window.set_property('skip-pager-hint', True)
+        self.window.set_accept_focus(False)
+        self.window.set_focus_on_map(False)
+        self.window.stick()
+        self.window.set_decorated(False)
+        self.window.set_keep_above(True)
+        self.lifecycle.connect(self.window, "expose-event", self.expose)
+
+        self.window.set_position(gtk.WIN_POS_NONE)
+        with span("move"):
+            self.window.move(self.x, self.y)
+        self.window.resize(self.width, self.height)
+        self.window.realize()
+        # No background for the X server to clear exposed parts to
+        self.window.window.set_back_pixmap(None, False)
+        self.window.window.input_shape_combine_region(gtk.gdk.Region(), 0, 0)
+        if not self.translucent:
+            self.shape()
+        if show:
+            self.window.show()
+
+    # Paint from the shared pattern, lined up with the screen so that the
+    # text continues across monitors. The source is part of the saved
+    # state, so the offset stays on the context; callers only paint
+    # after this, which does not depend on it.
+    def set_source(self, context):
+        context.translate(-self.x, -self.y)
+        context.set_source(self.tiles.get(self.message, self.color, self.face, self.weight))
+
+    # Paint the damaged region only
+    def expose(self, widget, event):
+        context = widget.window.cairo_create()
+        context.region(event.region)
+        context.clip()
+        if self.translucent:
+            context.set_operator(cairo.OPERATOR_SOURCE)
+            context.set_source_rgba(0, 0, 0, 0)
+            context.paint()
+            context.set_operator(cairo.OPERATOR_OVER)
+            self.set_source(context)
+            context.paint_with_alpha(self.opacity)
         else:
-            self.x_location = 0
-            self.y_location = 0
-            self.banners(options)
+            self.set_source(context)
+            context.paint()
+        return True
 
-    def banners(self, options):
-        # If the banner_width option is set, calculate how to center it on the screen
-        if options.banner_width > 0:
-            self.x_location = self.x / 2 - options.banner_width / 2 + self.x_location
+    # Cut the window down to the dithered text (no compositing manager).
+    # The dither is lined up with the screen like the text.
+    def shape(self):
+        mask = gtk.gdk.Pixmap(self.window.window, self.width, self.height, 1)
+        context = mask.cairo_create()
+        context.set_operator(cairo.OPERATOR_CLEAR)
+        context.paint()
+        context.set_operator(cairo.OPERATOR_OVER)
+        context.translate(-self.x, -self.y)
+        context.set_source(self.dither(self.opacity))
+        context.mask(self.tiles.get(self.message, self.color, self.face, self.weight))
+        self.window.window.shape_combine_mask(mask, 0, 0)
+
+    # Change the text and colors in place (see ClassificationBanner.restyle)
+    def restyle(self, message, fgcolor, bgcolor, face, size, weight, opacity):
+        if (message, bgcolor, face, weight) == (self.message, self.color, self.face, self.weight):
+            return
+        self.message = message
+        self.color = bgcolor
+        self.face = face
+        self.weight = weight
+        if not self.translucent:
+            self.shape()
+        self.window.queue_draw()
+
+    # Cover a monitor that moved or changed size
+    @traced("place")
+    def place(self, x, y, width, height):
+        self.x, self.y, self.width, self.height = x, y, width, height
+        with span("move"):
+            self.window.move(x, y)
+        self.window.resize(width, height)
+        if not self.translucent:
+            self.shape()
+        self.window.queue_draw()
+
+    def destroy(self):
+        self.lifecycle.close()
+        self.window.destroy()
 
-        if options.show_top:
-            top = ClassificationBanner(
-                options.message,
-                options.fgcolor,
-                options.bgcolor,
-                options.face,
-                options.size,
-                options.weight,
-                self.x,
-                self.y,
-                options.esc,
-                options.opacity,
-                options.sys_info,
-                options.taskbar_offset,
-                options.banner_width,
-                options.click_to_move)
-            top.window.move(self.x_location, self.y_location)
-
-        if options.show_bottom:
-            bottom = ClassificationBanner(
+    def show(self):
+        self.window.show()
+
+    def hide(self):
+        self.window.hide()
+
+
+class GtkBackend:
+    """Banner windows drawn with GTK on one screen (see display.py)."""
+
+    name = "gtk"
+    watermarks = True
+
+    def __init__(self, screen=None):
+        """Set up the backend
+
+        Keyword arguments:
+        screen -- gtk.gdk.Screen to show the banners on (default screen)
+        """
+        self.screen = screen or gtk.gdk.screen_get_default()
+        self.lifecycle = Lifecycle()
+        # In-process monitor geometry, cached per screen configuration
+        self.geometry = MonitorGeometry(self.screen)
+
+    def topology(self):
+        return self.geometry.topology()
+
+    def watch_screen(self, callback):
+        self.lifecycle.connect(self.screen, "size-changed", callback)
+
+        # Newer versions of pygtk have this signal
+        try:
+            self.lifecycle.connect(self.screen, "monitors-changed", callback)
+        except:
+            pass
+
+    # Returns an unmapped banner for a Window (or watermark Area) of the layout
+    def create_banner(self, options, window, escape):
+        if window.position == "watermark":
+            return WatermarkBanner(
                 options.message,
-                options.fgcolor,
                 options.bgcolor,
                 options.face,
-                options.size,
                 options.weight,
-                self.x,
-                self.y,
-                options.esc,
-                options.opacity,
-                options.sys_info,
-                options.taskbar_offset,
-                options.banner_width,
-                options.click_to_move)
-            bottom.window.move(self.x_location, int(bottom.vres))
-
-    # Relaunch the Classification Banner on Screen Resize
-    def resize(self, widget, data=None):
-        self.config = self.configure()
-        self.execute(self.config)
-        return True
-
-def main():
-    run = DisplayBanner()
-    gtk.main()
+                options.watermark_opacity,
+                self.screen,
+                (window.x, window.y, window.width, window.height),
+                False)
+        banner = ClassificationBanner(
+            options.message,
+            options.fgcolor,
+            options.bgcolor,
+            options.face,
+            options.size,
+            options.weight,
+            window.width,
+            0,
+            options.esc,
+            options.opacity,
+            options.sys_info,
+            options.taskbar_offset,
+            options.banner_width,
+            options.click_to_move,
+            options.renderer,
+            self.screen,
+            options.sys_info_left,
+            options.sys_info_right,
+            (window.x, window.y),
+            False)
+        banner.escape = escape
+        return banner
+
+    def color_error(self, values):
+        return color_error(values)
+
+    def flush(self):
+        gtk.gdk.flush()
+
+    def close(self):
+        self.lifecycle.close()
+
+
+# `trace` is the StartupTrace started by the bin script, if any
+def main(configuration=None, trace=None):
+    if trace is None:
+        trace = StartupTrace(START_TIME)
+    trace.mark("import")
+    if configuration is None:
+        configuration = Configuration()
+        trace.mark("configure")
+    if configuration.options.update:
+        sys.exit(instance.update(sys.argv[1:]))
+    if configuration.options.check is not None:
+        from classification_banner import check
+        sys.exit(check.main(sys.argv[1:]))
+    if configuration.options.multi_display:
+        from classification_banner import multidisplay
+        multidisplay.main(configuration)
+        return
+    serve(configuration, trace, GtkBackend)
@@ -0,0 +1,192 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+# classification-banner --check: validate configuration files and show
+# where the banners would go, without a display and without GTK, so that
+# it can run on configuration management servers.
+#
+
+import multiprocessing
+import os
+import re
+import sys
+from argparse import ArgumentParser
+
+from classification_banner.config import (CONF_FILE, DEFAULTS, DEFAULTSECT, ConfigError,
+                                          font_error, parse_options, read_config)
+from classification_banner.geometry import Topology
+from classification_banner.layout import compute_layout
+from classification_banner.sysinfo import FIELDS, template_fields
+
+# Where X11 keeps its color names
+RGB_FILES = ["/usr/share/X11/rgb.txt", "/etc/X11/rgb.txt", "/usr/lib/X11/rgb.txt"]
+
+HEX_COLOR = re.compile(r"^#([0-9a-fA-F]{3}){1,4}$")
+
+CHOICES = {
+    "renderer": ["widgets", "surface"],
+    "backend": ["gtk", "xlib"],
+}
+
+# Color names, read once per process
+color_names = None
+
+
+# Returns the X11 color names (lower case, without spaces), or None if
+# this host has no rgb.txt to check against
+def get_color_names():
+    global color_names
+    if color_names is None:
+        for path in RGB_FILES:
+            if os.path.isfile(path):
+                names = set()
+                with open(path) as rgb:
+                    for line in rgb:
+                        fields = line.split(None, 3)
+                        if len(fields) == 4 and not line.startswith("!"):
+                            names.add(fields[3].strip().replace(" ", "").lower())
+                color_names = names
+                break
+        else:
+            color_names = False
+    return color_names or None
+
+
+# Returns an error message for a color GTK would not accept, or None
+def check_color(value):
+    if value.startswith("#"):
+        if not HEX_COLOR.match(value):
+            return "%r is not a #RGB, #RRGGBB, #RRRGGGBBB or #RRRRGGGGBBBB color" % value
+        return None
+    names = get_color_names()
+    if names is not None and value.replace(" ", "").lower() not in names:
+        return "%r is not a known color name" % value
+    return None
+
+
+# Returns the error messages for a set of parsed options
+def check_options(options, keys):
+    errors = []
+    for key in sorted(keys):
+        if key not in DEFAULTS:
+            errors.append("%s: unknown option" % key)
+
+    for key in ["fgcolor", "bgcolor"]:
+        error = check_color(getattr(options, key))
+        if error:
+            errors.append("%s: %s" % (key, error))
+
+    for key in ["opacity", "watermark_opacity"]:
+        if not 0 <= getattr(options, key) <= 1:
+            errors.append("%s: %s is out of range [0, 1]" % (key, getattr(options, key)))
+    for key in ["hres", "vres", "taskbar_offset", "banner_width", "relayout_delay"]:
+        if getattr(options, key) < 0:
+            errors.append("%s: %s must not be negative" % (key, getattr(options, key)))
+    if (options.hres == 0) != (options.vres == 0):
+        errors.append("hres/vres: both or neither must be set")
+    if options.sys_info_interval < 1:
+        errors.append("sys_info_interval: must be at least 1 second")
+
+    for key in ["size", "weight"]:
+        error = font_error(key, getattr(options, key))
+        if error:
+            errors.append(error)
+    for key, choices in sorted(CHOICES.items()):
+        if getattr(options, key) not in choices:
+            errors.append("%s: %r is not one of %s" % (key, getattr(options, key), ", ".join(choices)))
+    for key in ["sys_info_left", "sys_info_right"]:
+        try:
+            unknown = [name for name in template_fields(getattr(options, key)) if name not in FIELDS]
+        except ValueError as e:
+            errors.append("%s: %s" % (key, e))
+            continue
+        if unknown:
+            errors.append("%s: unknown field(s) %s" % (key, ", ".join(unknown)))
+    return errors
+
+
+# Parse a --topology specification: WIDTHxHEIGHT+X+Y monitors, comma separated
+def parse_topology(text):
+    monitors = []
+    for spec in text.split(","):
+        match = re.match(r"^(\d+)x(\d+)\+(\d+)\+(\d+)$", spec.strip())
+        if not match:
+            raise ValueError("bad monitor %r, expected WIDTHxHEIGHT+X+Y" % spec)
+        monitors.append(tuple(int(n) for n in match.groups()[2:] + match.groups()[:2]))
+    width = max(x + w for x, y, w, h in monitors)
+    height = max(y + h for x, y, w, h in monitors)
+    return Topology(width, height, tuple(monitors), 0)
+
+
+# Check one file. Returns (path, errors, banner windows); runs in a worker
+# process, so everything returned is plain data.
+def check_file(job):
+    path, heading, topology = job
+    errors = []
+    try:
+        values = read_config(path, heading, errors)
+    except (ConfigError, ValueError, IOError, OSError) as e:
+        return path, [str(e).strip()], []
+    options = parse_options(values, [])
+    errors.extend(check_options(options, values.keys()))
+    if errors:
+        return path, errors, []
+    windows = compute_layout(topology, options.hres, options.vres, options.spanning,
+                             options.taskbar_offset, options.banner_width,
+                             options.show_top, options.show_bottom, options.watermark)
+    return path, errors, [tuple(window) for window in windows]
+
+
+def check_files(paths, heading, topology, jobs):
+    work = [(path, heading, topology) for path in paths]
+    if jobs == 1 or len(work) == 1:
+        return [check_file(job) for job in work]
+    pool = multiprocessing.Pool(jobs)
+    try:
+        return pool.map(check_file, work, max(1, len(work) // (jobs * 4)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+# classification-banner --check [FILE ...]. Returns the exit status.
+def main(args):
+    parser = ArgumentParser(prog="classification-banner --check",
+                            description="Validate configuration files without a display")
+    parser.add_argument("--check", nargs="*", metavar="FILE",
+                        help="Configuration files to check (default %s)" % CONF_FILE)
+    parser.add_argument("--heading", default=DEFAULTSECT,
+                        help="Specify the config. section to use.")
+    parser.add_argument("--topology", default="1920x1080+0+0",
+                        help="Monitors to lay out the banners on, e.g. 1920x1080+0+0,1280x1024+1920+0")
+    parser.add_argument("-j", "--jobs", type=int, default=multiprocessing.cpu_count(),
+                        help="Files checked in parallel (default: one per CPU)")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Only report files with errors")
+    options = parser.parse_args(args)
+    try:
+        topology = parse_topology(options.topology)
+    except ValueError as e:
+        parser.error(str(e))
+
+    failed = 0
+    for path, errors, windows in check_files(options.check or [CONF_FILE], options.heading,
+                                             topology, max(1, options.jobs)):
+        if errors:
+            failed += 1
+            sys.stdout.write("%s: %d error(s)\n" % (path, len(errors)))
+            for error in errors:
+                sys.stdout.write("  %s\n" % error)
+        elif not options.quiet:
+            sys.stdout.write("%s: OK\n" % path)
+            for window in windows:
+                monitor, position, x, y, width = window[:5]
+                if position == "watermark":
+                    extra = " height=%d" % window[5]
+                elif position == "bottom":
+                    extra = " (bottom edge)"
+                else:
+                    extra = ""
+                sys.stdout.write("  %-9s monitor %d  x=%d y=%d width=%d%s\n" % (
+                    position, monitor, x, y, width, extra))
+    return 1 if failed else 0
@@ -0,0 +1,375 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+
+import os
+import sys
+from argparse import ArgumentParser, Namespace, RawDescriptionHelpFormatter
+
+from classification_banner.tracing import traced
+
+try:
+    from ConfigParser import ConfigParser, MissingSectionHeaderError, DEFAULTSECT
+    from ConfigParser import Error as ConfigError
+    from StringIO import StringIO
+except ImportError:
+    from configparser import ConfigParser, MissingSectionHeaderError, DEFAULTSECT
+    from configparser import Error as ConfigError
+    from io import StringIO
+
+# Global Configuration File
+CONF_FILE = "/etc/classification-banner"
+
+# Default quiet period (milliseconds) before a relayout
+RELAYOUT_DELAY = 250
+
+# Built-in option values, overridden by the configuration file and the
+# command line
+DEFAULTS = {
+    "message": "UNCLASSIFIED",
+    "fgcolor": "#FFFFFF",
+    "bgcolor": "#007A33",
+    "face": "liberation-sans",
+    "size": "small",
+    "weight": "bold",
+    "show_top": True,
+    "show_bottom": True,
+    "hres": 0,
+    "vres": 0,
+    "sys_info": False,
+    "opacity": 0.75,
+    "esc": True,
+    "spanning": False,
+    "click_to_move": False,
+    "banner_width": 0,
+    "taskbar_offset": 0,
+    "relayout_delay": RELAYOUT_DELAY,
+    "renderer": "widgets",
+    "backend": "gtk",
+    "reserve_space": False,
+    "metrics_socket": "",
+    "power_save": True,
+    "sys_info_left": "{host}",
+    "sys_info_right": "{user}",
+    "sys_info_interval": 1,
+    "watermark": False,
+    "watermark_opacity": 0.1,
+}
+
+# Options that need to be coerced from strings
+BOOLEAN_OPTIONS = ["show_top", "show_bottom", "sys_info", "esc", "spanning", "click_to_move", "power_save",
+                   "reserve_space", "watermark"]
+INTEGER_OPTIONS = ["hres", "vres", "taskbar_offset", "banner_width", "relayout_delay",
+                   "sys_info_interval"]
+FLOAT_OPTIONS = ["opacity", "watermark_opacity"]
+
+# Options that can be changed on running banners with the "update" command
+LIVE_OPTIONS = ["message", "fgcolor", "bgcolor", "face", "size", "weight"]
+
+# Font sizes and weights Pango knows by name
+SIZES = ["xx-small", "x-small", "small", "medium", "large", "x-large", "xx-large",
+         "smaller", "larger"]
+WEIGHTS = ["ultralight", "light", "normal", "bold", "ultrabold", "heavy"]
+
+# Command line parsers, built on first use
+parsers = None
+
+
+# Returns the option values of one section of a configuration file. A
+# value of the wrong type raises ValueError, unless an `errors` list is
+# given: the message is then added to it, the built-in default is used
+# instead and the remaining values are still read.
+def read_config(config_file, heading=DEFAULTSECT, errors=None):
+    defaults = dict(DEFAULTS)
+    if config_file is None:
+        return defaults
+
+    with open(config_file) as fp:
+        text = fp.read()
+
+    # In order to maintain backwards compatibility with the previous
+    # configuration file format, a dummy section may need to be added
+    # to the configuration file.  This is done in memory in order to
+    # avoid overwriting the user's configuration.
+    config = ConfigParser()
+    try:
+        parse(config, text, config_file)
+    except MissingSectionHeaderError:
+        config = ConfigParser()
+        parse(config, "[%s]\n" % DEFAULTSECT + text, config_file)
+
+    # ConfigParser treats everything as strings and any quotation
+    # marks in a setting are explicitly added to the string.
+    # One way to fix this is to add everything to the defaults and
+    # then strip the quotation marks off of everything.
+    defaults.update(dict(config.items(heading)))
+    for key, val in defaults.items():
+        if config.has_option(heading, key):
+            defaults[key] = val.strip("\"'")
+    # TODO: This coercion section is hacky and should be fixed.
+    coercions = [(BOOLEAN_OPTIONS, config.getboolean),
+                 (INTEGER_OPTIONS, config.getint),
+                 (FLOAT_OPTIONS, config.getfloat)]
+    for keys, get in coercions:
+        for key in keys:
+            if config.has_option(heading, key):
+                try:
+                    defaults[key] = get(heading, key)
+                except ValueError as e:
+                    if errors is None:
+                        raise ValueError("%s: %s" % (key, e))
+                    errors.append("%s: %s" % (key, e))
+                    defaults[key] = DEFAULTS[key]
+    return defaults
+
+
+def parse(config, text, config_file):
+    if sys.hexversion >= 0x03000000:
+        config.read_file(StringIO(text), source=config_file)
+    else:
+        config.readfp(StringIO(text), config_file)
+
+
+# Returns what identifies a version of a file on disk
+def stat_key(config_file):
+    if config_file is None:
+        return None
+    st = os.stat(config_file)
+    return (st.st_dev, st.st_ino, st.st_mtime, st.st_size)
+
+
+class ConfigCache:
+    """Coerced configuration options, re-parsed only when the file changes.
+
+    A file is considered changed when its inode, mtime or size differ from
+    the version that was parsed last.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.options = None
+
+    def load(self, config_file, heading=DEFAULTSECT):
+        key = (config_file, heading, stat_key(config_file))
+        if key != self.key:
+            self.options = read_config(config_file, heading)
+            self.key = key
+        return self.options
+
+
+# Returns the parser for the configuration file location and the parser
+# for the whole command line. They are built once and reused for every
+# (re)configuration.
+def argument_parsers():
+    global parsers
+    if parsers is not None:
+        return parsers
+
+    # Check if a configuration file was passed in from the command line
+    conf_parser = ArgumentParser(
+        formatter_class=RawDescriptionHelpFormatter,
+        add_help=False)
+    conf_parser.add_argument("-c", "--config",
+                            help="Specify the configuration file",
+                            metavar="FILE")
+    conf_parser.add_argument("--heading",
+                            help="Specify the config. section to use.",
+                            default=DEFAULTSECT)
+
+    # The defaults come from the configuration file, see parse_options()
+    parser = ArgumentParser(parents=[conf_parser])
+    parser.add_argument("-m", "--message",
+                      help="Set the Classification message")
+    parser.add_argument("-f", "--fgcolor",
+                      help="Set the Foreground (text) color")
+    parser.add_argument("-b", "--bgcolor",
+                      help="Set the Background color")
+    parser.add_argument("-x", "--hres", type=int,
+                      help="Set the Horizontal Screen Resolution")
+    parser.add_argument("-y", "--vres", type=int,
+                      help="Set the Vertical Screen Resolution")
+    parser.add_argument("-o", "--opacity",
+                      type=float, dest="opacity",
+                      help="Set the window opacity for composted window managers")
+    parser.add_argument("--face", help="Font face")
+    parser.add_argument("--size", help="Font size")
+    parser.add_argument("--weight",
+                      help="Set the Font weight")
+    parser.add_argument("--disable-esc",
+                      dest="esc", action="store_false",
+                      help="Disable the 'ESC to hide' feature and don't show the banner message")
+    parser.add_argument("--hide-top",
+                      dest="show_top", action="store_false",
+                      help="Disable the top banner")
+    parser.add_argument("--hide-bottom",
+                      dest="show_bottom", action="store_false",
+                      help="Disable the bottom banner")
+    parser.add_argument("--system-info",
+                      dest="sys_info", action="store_true",
+                      help="Show user and hostname in the top banner")
+    parser.add_argument("--sys-info-left", dest="sys_info_left", metavar="TEMPLATE",
+                      help="System info shown on the left, e.g. '{host} {ip}'. Fields: user, host, ip, clock, date, session_age")
+    parser.add_argument("--sys-info-right", dest="sys_info_right", metavar="TEMPLATE",
+                      help="System info shown on the right, e.g. '{user} {clock}'")
+    parser.add_argument("--sys-info-interval", dest="sys_info_interval", type=int,
+                      help="Seconds between refreshes of live system info fields")
+    parser.add_argument("--enable-spanning",
+                      dest="spanning", action="store_true",
+                      help="Enable banner(s) to span across screens as a single banner")
+    parser.add_argument("--enable-click_to_move",
+                      dest="click_to_move", action="store_true",
+                      help="Enable left-click to move the banner to the side to access UI elements that may be hidden.")
+    parser.add_argument("--reserve-space",
+                      dest="reserve_space", action="store_true",
+                      help="Keep maximized windows from being placed underneath the banners (_NET_WM_STRUT_PARTIAL)")
+    parser.add_argument("--disable-power-save",
+                      dest="power_save", action="store_false",
+                      help="Keep the banners mapped and updated while the session is locked")
+    parser.add_argument("--watermark", action="store_true",
+                      help="Also draw the classification diagonally across every monitor. Clicks and keys pass through it.")
+    parser.add_argument("--watermark-opacity", dest="watermark_opacity", type=float,
+                      help="Opacity of the watermark text [0 .. 1, default 0.1]")
+    parser.add_argument("--banner_width",
+                      dest="banner_width", type=int, metavar="PIXELS",
+                      help="Set a width in pixels for the banner. 0 is full-screen")
+    parser.add_argument("--taskbar-offset", type=int,
+                      help="Set the offset for the size of the task bar")
+    parser.add_argument("--relayout-delay", type=int,
+                      help="Milliseconds of quiet after a screen change before the banners are laid out again")
+    parser.add_argument("--renderer", choices=["widgets", "surface"],
+                      help="Draw banners with labels (widgets) or from one cached image (surface)")
+    parser.add_argument("--backend", choices=["gtk", "xlib"],
+                      help="Draw banners with GTK, or with python-xlib for less memory and a faster start")
+    parser.add_argument("--multi-display", action="store_true",
+                      help="Serve the banners of every local X display (terminal servers)")
+    parser.add_argument("--displays", metavar="DISPLAYS",
+                      help="Comma-separated X displays to serve in multi-display mode instead of discovering them")
+    parser.add_argument("--metrics-socket", metavar="PATH",
+                      help="Serve live counters as JSON on this Unix socket (@name for the abstract namespace)")
+    parser.add_argument("--check", nargs="*", metavar="FILE",
+                      help="Validate configuration files and print where the banners would go, without a display, and exit")
+    parser.add_argument("--update", action="store_true",
+                      help="Change the message, colors or font of the banner already running on this display and exit")
+    parser.add_argument("--new-instance", action="store_true",
+                      help="Start even if a banner is already running on this display")
+    parser.add_argument("--startup-trace", action="store_true",
+                      help="Report the time spent in each start-up phase until the first banner is shown, and the duration of every relayout")
+
+    parsers = (conf_parser, parser)
+    return parsers
+
+
+# Parse the command line on top of the configuration file options
+def parse_options(defaults, args=None):
+    conf_parser, parser = argument_parsers()
+    parser.set_defaults(**defaults)
+    return parser.parse_args(args)
+
+
+# Returns an error message for a font size or weight Pango would not
+# accept, or None
+def font_error(key, value):
+    names = {"size": SIZES, "weight": WEIGHTS}[key]
+    if value not in names and not value.isdigit():
+        return "%s: %r is neither a number nor one of %s" % (key, value, ", ".join(names))
+    return None
+
+
+# Returns the error messages for a set of options (see check.check_options).
+# Unknown keys are not reported, they are ignored as on start-up.
+def option_errors(options):
+    # Imported here, check.py builds on this module
+    from classification_banner.check import check_options
+    return check_options(options, [])
+
+
+# Returns the live options of an "update" command and an error message
+def live_values(command):
+    values = {}
+    for key, value in command.items():
+        if key == "command":
+            continue
+        if key not in LIVE_OPTIONS:
+            return None, "%s cannot be changed on a running banner" % key
+        if not isinstance(value, (str, type(u""))):
+            return None, "%s must be a string" % key
+        if key in ("size", "weight") and font_error(key, value):
+            return None, font_error(key, value)
+        values[str(key)] = value
+    if not values:
+        return None, "nothing to update, expected one of %s" % ", ".join(LIVE_OPTIONS)
+    return values, None
+
+
+class Configuration:
+    """The options in effect: the configuration file overridden by the
+    command line.
+
+    The file is parsed once; reload() re-reads it after it changed on disk
+    and keeps the previous options if the new content cannot be parsed or
+    holds invalid values.
+    """
+
+    @traced("configure")
+    def __init__(self, args=None, cwd=None):
+        self.args = args
+        self.cache = ConfigCache()
+        self.reloads = 0
+        self.overrides = {}
+
+        # Check if a configuration file was passed in from the command line
+        conf_parser, parser = argument_parsers()
+        options, rest = conf_parser.parse_known_args(args)
+
+        config_file = None
+        if options.config:
+            config_file = os.path.abspath(os.path.join(cwd or os.getcwd(), options.config))
+            if not os.path.isfile(config_file):
+                print("ERROR: Specified configuration file does not exist.")
+                sys.exit(1)
+            self.path = config_file
+        else:
+            config_file = os.path.abspath(CONF_FILE)
+            self.path = config_file
+            if not os.path.isfile(config_file):
+                config_file = None
+        self.heading = options.heading
+
+        self.options = parse_options(self.cache.load(config_file, self.heading), args)
+
+    # Returns the new options if the configuration file changed, else None.
+    # Options for which `validate` returns errors are not taken.
+    @traced("reload configuration")
+    def reload(self, validate=option_errors):
+        if not os.path.isfile(self.path):
+            return None
+        try:
+            defaults = self.cache.load(self.path, self.heading)
+        except (ConfigError, ValueError) as e:
+            sys.stderr.write("classification-banner: keeping previous configuration: %s\n" % e)
+            return None
+        options = self.overridden(parse_options(defaults, self.args))
+        if options == self.options:
+            return None
+        errors = validate(options)
+        if errors:
+            sys.stderr.write("classification-banner: keeping previous configuration: %s\n" %
+                             "; ".join(errors))
+            return None
+        self.options = options
+        self.reloads += 1
+        return options
+
+    # Returns the options with values changed on the running banner. They
+    # stay in effect when the configuration file is reloaded.
+    def override(self, values):
+        self.overrides.update(values)
+        self.options = self.overridden(self.options)
+        return self.options
+
+    def overridden(self, options):
+        if not self.overrides:
+            return options
+        values = vars(options).copy()
+        values.update(self.overrides)
+        return Namespace(**values)
@@ -0,0 +1,474 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+# The banners of one screen, whatever draws them. Layout, relayouts after
+# screen changes, configuration reloads, live updates, ESC, the session
+# lock and the metrics are handled here once; a backend provides the
+# windows and the screen:
+#
+#   name                    "gtk" or "xlib", reported in the metrics
+#   watermarks              whether it can draw watermark windows
+#   topology()              the Topology of the screen (see geometry.py)
+#   watch_screen(callback)  call back on every screen change
+#   create_banner(options, window, escape)
+#                           an unmapped window for a Window (or watermark
+#                           Area) of the layout, created at the window's
+#                           position; escape(banner) is called on ESC
+#   color_error(values)     an error message for a fgcolor or bgcolor it
+#                           cannot draw, or None
+#   flush()                 send the queued requests to the X server
+#   close()                 stop watching the screen
+#
+# Its banner windows provide:
+#
+#   height                  in pixels
+#   place(x, y, width)      move and resize (watermarks take a height too)
+#   restyle(message, fgcolor, bgcolor, face, size, weight, opacity)
+#   reserve(values)         set the struts (see layout.strut), None clears them
+#   show(), hide()          map and unmap
+#   notify_mapped(callback) call back once the window is on screen
+#   destroy()
+#
+# The GTK backend is in banner.py, the xlib backend in xbanner.py. Timers
+# and watches go through the main loop of the process (see mainloop.py).
+#
+
+import socket
+import sys
+import time
+
+from classification_banner import config, instance, mainloop, tracing
+from classification_banner.config import Configuration, live_values
+from classification_banner.ipc import CommandServer
+from classification_banner.layout import by_monitor, diff_layout, layout_engine, strut
+from classification_banner.lifecycle import Lifecycle
+from classification_banner.lock import LockMonitor
+from classification_banner.metrics import MetricsServer, RelayoutMetrics
+from classification_banner.scheduler import RelayoutScheduler, UpdateQueue
+from classification_banner.sysinfo import live_info
+from classification_banner.tracing import span, traced
+from classification_banner.watcher import ConfigWatcher
+
+# Seconds a banner stays hidden after pressing ESC
+HIDE_TIMEOUT = 15
+
+# Options that change which windows a banner is made of
+REBUILD_OPTIONS = ["esc", "sys_info", "sys_info_left", "sys_info_right", "click_to_move",
+                   "show_top", "show_bottom", "renderer", "reserve_space",
+                   "watermark", "watermark_opacity"]
+
+# Options that can be changed on a live banner
+STYLE_OPTIONS = ["message", "fgcolor", "bgcolor", "face", "size", "weight", "opacity"]
+
+
+class DisplayBanner:
+
+    """Display Classification Banner Message"""
+    def __init__(self, backend, configuration, trace=None, watch_config=True):
+        """Set up the banners of one screen
+
+        Keyword arguments:
+        backend       -- Draws the windows, see the top of this file
+        configuration -- Configuration to use
+        trace         -- StartupTrace to report start-up phases to
+        watch_config  -- Reload the configuration file when it changes. Owners of a configuration shared by several displays do this themselves and push the new options with apply().
+        """
+        self.backend = backend
+        self.configuration = configuration
+        self.config = self.configuration.options
+
+        # Only keep timing start-up when asked to report it
+        self.trace = trace if self.config.startup_trace else None
+        self.awaiting_map = self.trace is not None
+
+        # Dynamic Resolution Scaling. All screen-change notifications go
+        # through one scheduler so that a burst of them results in a single
+        # relayout. The lifecycle owns every banner window so that close()
+        # can release all of them.
+        self.lifecycle = Lifecycle()
+        self.scheduler = RelayoutScheduler(self.relayout, self.config.relayout_delay)
+        self.updates = UpdateQueue(self.apply_update)
+        self.locked = False
+        self.deferred = None
+        self.backend.watch_screen(self.scheduler.notify)
+
+        # Banners hidden with ESC, and the timers bringing them back
+        self.hidden = {}
+
+        # Pick up changes to the configuration file while running
+        self.watcher = None
+        if watch_config:
+            self.watcher = ConfigWatcher(self.configuration.path, self.reload)
+
+        # System info refresh rate, shared by every banner of the process
+        live_info.set_interval(self.config.sys_info_interval)
+
+        # Counters exposed through --metrics-socket
+        self.relayout_metrics = RelayoutMetrics()
+        self.topology = None
+
+        # Live banner windows keyed by monitor index, and the placement
+        # they were last laid out with
+        self.banner_windows = {}
+        self.geometry = {}
+
+        # Monitors whose banners are created once the main loop is idle
+        self.pending_monitors = []
+        self.pending_source = None
+
+        # Launch Banner
+        self.execute(self.config)
+        if self.trace is not None:
+            self.trace.mark("first banner")
+
+    # Launch the Classification Banner Window(s)
+    def execute(self, options, defer=True):
+        with span("geometry"):
+            self.topology = self.backend.topology()
+        if self.trace is not None and not self.geometry:
+            self.trace.mark("geometry")
+        windows = layout_engine.layout(self.topology, options)
+        if not self.backend.watermarks:
+            windows = [window for window in windows if window.position != "watermark"]
+        self.banners(options, by_monitor(windows), defer)
+
+    # Bring the live banner windows in line with a new layout. Windows are
+    # only created or destroyed when a monitor appears or disappears; the
+    # banners of a monitor that merely moved or changed size are moved and
+    # resized in place. Unless `defer` is False, only the banners of one
+    # new monitor are created right away.
+    def banners(self, options, layout, defer=True):
+        removed, moved, added = diff_layout(self.geometry, layout)
+        for index in removed:
+            for banner in self.banner_windows.pop(index).values():
+                self.release(banner)
+        for index in moved:
+            windows = self.banner_windows[index]
+            for position, window in layout[index].items():
+                if position not in windows:
+                    continue
+                banner = windows[position]
+                if position == "watermark":
+                    banner.place(window.x, window.y, window.width, window.height)
+                else:
+                    banner.place(window.x, self.y(window, banner), window.width)
+        if options.reserve_space:
+            # Struts are measured from the edges of the whole screen and
+            # depend on the neighbouring monitors, so a banner that did not
+            # move may still need new ones
+            for index, windows in self.banner_windows.items():
+                for position, banner in windows.items():
+                    if position != "watermark" and position in layout[index]:
+                        self.reserve(banner, layout[index][position])
+        for index in added:
+            self.banner_windows[index] = {}
+
+        self.geometry = layout
+        if not defer:
+            self.populate(added)
+            return
+
+        # Show the primary monitor's banners right away and leave the other
+        # monitors until the main loop is idle
+        if self.topology.primary in added:
+            self.populate([self.topology.primary])
+            added.remove(self.topology.primary)
+        elif added:
+            self.populate([added.pop(0)])
+        if added:
+            self.pending_monitors.extend(added)
+            if self.pending_source is None:
+                self.pending_source = mainloop.get().idle_add(self.populate_pending)
+
+    # Create the missing banner windows of some monitors as one batch: every
+    # window is created at its final geometry with its properties set, then
+    # all of them are mapped together and the requests flushed once.
+    def populate(self, indexes):
+        created = []
+        for index in indexes:
+            windows = self.banner_windows.get(index)
+            if windows is None:
+                continue
+            for position, window in self.geometry[index].items():
+                if position not in windows:
+                    banner = windows[position] = self.lifecycle.adopt(
+                        self.backend.create_banner(self.config, window, self.escape))
+                    if position == "bottom":
+                        # Its height is only known now
+                        banner.place(window.x, self.y(window, banner), window.width)
+                    if self.config.reserve_space and position != "watermark":
+                        self.reserve(banner, window)
+                    created.append((position, banner))
+
+        if not self.locked:
+            for position, banner in created:
+                if self.awaiting_map and position != "watermark":
+                    self.awaiting_map = False
+                    banner.notify_mapped(self.trace.mapped)
+                with span("show"):
+                    banner.show()
+        if created:
+            self.backend.flush()
+
+    def populate_pending(self):
+        self.pending_source = None
+        indexes, self.pending_monitors = self.pending_monitors, []
+        self.populate(indexes)
+        return False
+
+    # Bottom banners are laid out at the bottom edge of their monitor and
+    # go right above it
+    def y(self, window, banner):
+        if window.position == "bottom":
+            return window.y - banner.height
+        return window.y
+
+    def reserve(self, banner, window):
+        banner.reserve(strut(window, banner.height, self.topology))
+
+    # Destroy a banner window along with its ESC timer
+    def release(self, banner):
+        if banner in self.hidden:
+            mainloop.get().source_remove(self.hidden.pop(banner))
+        self.lifecycle.release(banner)
+
+    # ESC on a banner hides it. A hidden window gets no keys, so pressing
+    # ESC on another banner of the display also restarts the timer of the
+    # banners already hidden, and they all come back together.
+    def escape(self, pressed):
+        for banner in list(self.hidden):
+            if banner is not pressed:
+                self.hide(banner)
+        self.hide(pressed)
+
+    # Hide a banner and let the main loop bring it back later. Hiding
+    # again while the timer is pending (e.g. ESC auto-repeat) restarts it.
+    def hide(self, banner, seconds=HIDE_TIMEOUT):
+        loop = mainloop.get()
+        if banner in self.hidden:
+            loop.source_remove(self.hidden[banner])
+        self.hidden[banner] = loop.timeout_add_seconds(seconds, self.unhide, banner)
+        banner.hide()
+        self.backend.flush()
+
+    def unhide(self, banner):
+        del self.hidden[banner]
+        banner.show()
+        self.backend.flush()
+        return False
+
+    # Relayout the Classification Banner on Screen Resize
+    @traced("relayout")
+    def relayout(self):
+        start = time.time()
+        if self.backend.topology() != self.topology:
+            self.execute(self.config)
+            self.relayout_metrics.observe(time.time() - start)
+            if self.trace is not None:
+                self.trace.report("relayout", time.time() - start)
+
+    # Returns the live counters of this display (see MetricsServer)
+    def snapshot(self):
+        data = self.relayout_metrics.snapshot()
+        data["backend"] = self.backend.name
+        data["windows"] = dict((str(index), len(windows))
+                               for index, windows in self.banner_windows.items())
+        data["screen_events"] = self.scheduler.events
+        data["screen_events_coalesced"] = self.scheduler.coalesced
+        data["config_reloads"] = self.configuration.reloads
+        data["updates"] = self.updates.pushed
+        data["updates_applied"] = self.updates.applied
+        data["locked"] = self.locked
+        return data
+
+    # Returns the error messages for a set of options, including colors
+    # the backend cannot draw but the X11 color names of this host do not
+    # rule out
+    def option_errors(self, options):
+        errors = config.option_errors(options)
+        if not errors:
+            error = self.backend.color_error(vars(options))
+            if error:
+                errors.append(error)
+        return errors
+
+    # Re-read the configuration file after it changed on disk. A file
+    # that cannot be parsed or holds invalid values leaves the running
+    # banners untouched.
+    def reload(self):
+        options = self.configuration.reload(self.option_errors)
+        if options is not None:
+            self.apply(options)
+
+    # Push a new set of options to the running banners. Returns the error
+    # messages of options that are not taken; the banners then keep the
+    # last good ones.
+    @traced("apply options")
+    def apply(self, options):
+        errors = self.option_errors(options)
+        if errors:
+            sys.stderr.write("classification-banner: keeping previous options: %s\n" %
+                             "; ".join(errors))
+            return errors
+        if self.locked:
+            # Caught up with in one go when the session is unlocked
+            self.deferred = options
+            return []
+        old, self.config = self.config, options
+        self.scheduler.delay = options.relayout_delay
+        live_info.set_interval(options.sys_info_interval)
+        if any(getattr(old, key) != getattr(options, key) for key in REBUILD_OPTIONS):
+            self.rebuild(options)
+            return []
+        if any(getattr(old, key) != getattr(options, key) for key in STYLE_OPTIONS):
+            for index, windows in self.banner_windows.items():
+                for position, banner in windows.items():
+                    banner.restyle(options.message, options.fgcolor, options.bgcolor,
+                                   options.face, options.size, options.weight,
+                                   options.opacity)
+                    if position == "bottom":
+                        # A new font can change the height
+                        window = self.geometry[index][position]
+                        banner.place(window.x, self.y(window, banner), window.width)
+            self.backend.flush()
+        # Placement changes are applied in place by the relayout
+        self.execute(options)
+        return []
+
+    # The banners are made up of different windows: start over. Every new
+    # banner is created before the old ones are let go, so the screen is
+    # never left without a classification banner.
+    def rebuild(self, options):
+        old = self.banner_windows
+        self.banner_windows = {}
+        self.geometry = {}
+        self.pending_monitors = []
+        self.execute(options, defer=False)
+        for windows in old.values():
+            for banner in windows.values():
+                self.release(banner)
+        self.backend.flush()
+
+    # Change the classification of the live banners ("update" command)
+    def update(self, command):
+        values, error = live_values(command)
+        if error is None:
+            error = self.backend.color_error(values)
+        if error:
+            return {"error": error}
+        self.updates.push(values)
+        return {}
+
+    def apply_update(self, values):
+        self.apply(self.configuration.override(values))
+
+    # Follow the session lock state (see LockMonitor). While locked the
+    # banners are unmapped, and screen changes, reloads and updates are
+    # held back; unlocking catches up on all of them with one relayout.
+    def set_locked(self, locked):
+        if locked == self.locked:
+            return
+        self.locked = locked
+        if locked:
+            self.scheduler.pause()
+            live_info.pause()
+            for timer in self.hidden.values():
+                mainloop.get().source_remove(timer)
+            self.hidden = {}
+        else:
+            self.scheduler.resume()
+            live_info.resume()
+        for windows in self.banner_windows.values():
+            for banner in windows.values():
+                if locked:
+                    banner.hide()
+                else:
+                    banner.show()
+        self.backend.flush()
+        if not locked:
+            options, self.deferred = self.deferred, None
+            if options is not None:
+                self.apply(options)
+            else:
+                self.relayout()
+
+    # Set the lock state by hand ("lock" command)
+    def lock(self, command):
+        self.set_locked(bool(command.get("locked", True)))
+        return {}
+
+    # Apply the command line of a second invocation on this display
+    def forwarded(self, command):
+        try:
+            configuration = Configuration(command.get("args", []), command.get("cwd"))
+        except SystemExit:
+            return {"error": "invalid options, see the running banner's output"}
+        errors = self.option_errors(configuration.options)
+        if errors:
+            return {"error": "; ".join(errors)}
+        self.reconfigure(configuration)
+        return {}
+
+    # Switch to a different set of options, possibly from another file
+    def reconfigure(self, configuration):
+        if self.watcher is not None and configuration.path != self.configuration.path:
+            self.watcher.destroy()
+            self.watcher = ConfigWatcher(configuration.path, self.reload)
+        configuration.reloads = self.configuration.reloads
+        self.configuration = configuration
+        if configuration.options != self.config:
+            self.apply(configuration.options)
+
+    # Tear down every banner window and stop watching the screen
+    def close(self):
+        loop = mainloop.get()
+        self.scheduler.cancel()
+        self.updates.cancel()
+        if self.watcher is not None:
+            self.watcher.destroy()
+            self.watcher = None
+        if self.pending_source is not None:
+            loop.source_remove(self.pending_source)
+            self.pending_source = None
+        self.pending_monitors = []
+        for timer in self.hidden.values():
+            loop.source_remove(timer)
+        self.hidden = {}
+        self.lifecycle.close()
+        self.backend.close()
+        self.banner_windows = {}
+        self.geometry = {}
+        self.topology = None
+
+
+# Claim the display, then show the banners and serve commands until the
+# main loop ends. `backend` is the backend class, only instantiated once
+# the display is ours: if a banner is already running on it, that banner
+# takes over our options and nothing is shown.
+def serve(configuration, trace, backend):
+    options = configuration.options
+    server = None
+    if not options.new_instance:
+        handlers = {}
+        try:
+            server = CommandServer(instance.address(), handlers)
+        except socket.error:
+            if instance.forward(sys.argv[1:]):
+                return
+            # Held by someone else's process, which we do not talk to
+            sys.stderr.write("classification-banner: running without the command socket\n")
+    tracing.start()
+    display = DisplayBanner(backend(), configuration, trace)
+    if server is not None:
+        handlers["options"] = display.forwarded
+        handlers["update"] = display.update
+        handlers["lock"] = display.lock
+    if options.power_save:
+        lock = LockMonitor(display.set_locked)
+    if options.metrics_socket:
+        try:
+            metrics = MetricsServer(options.metrics_socket, display.snapshot)
+        except socket.error as e:
+            sys.stderr.write("classification-banner: metrics are disabled, cannot bind %s: %s\n" %
+                             (options.metrics_socket, e))
+    mainloop.get().run()
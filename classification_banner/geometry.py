@@ -0,0 +1,48 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+
+from collections import namedtuple
+
+# Resolved screen configuration. Monitors are (x, y, width, height) tuples.
+Topology = namedtuple("Topology", "width height monitors primary")
+
+# Number of distinct screen configurations to remember (docked, undocked,
+# projector, ...)
+CACHE_SIZE = 16
+
+
+class MonitorGeometry:
+    """Query the monitor layout of a screen in-process.
+
+    The screen is anything implementing the gtk.gdk.Screen monitor API.
+    Resolved topologies are cached by a fingerprint of the screen
+    configuration, so asking again for an unchanged layout returns the
+    very same Topology object.
+    """
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.cache = {}
+
+    # Returns a fingerprint of the current screen configuration
+    def fingerprint(self):
+        screen = self.screen
+        monitors = tuple(tuple(screen.get_monitor_geometry(i))
+                         for i in range(screen.get_n_monitors()))
+        # Older versions of pygtk do not know about the primary monitor
+        try:
+            primary = screen.get_primary_monitor()
+        except AttributeError:
+            primary = 0
+        return (screen.get_width(), screen.get_height(), monitors, primary)
+
+    # Returns the (cached) Topology of the screen
+    def topology(self):
+        key = self.fingerprint()
+        topology = self.cache.get(key)
+        if topology is None:
+            if len(self.cache) >= CACHE_SIZE:
+                self.cache.clear()
+            topology = self.cache[key] = Topology(*key)
+        return topology
@@ -0,0 +1,133 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+# Talks to the banner already running on a display. This module is used
+# before GTK is imported, so it must stay free of GTK and gobject.
+#
+
+import json
+import os
+import socket
+import struct
+import sys
+from argparse import ArgumentParser
+
+from classification_banner.config import LIVE_OPTIONS, argument_parsers
+
+# Seconds to wait for the running banner to answer
+TIMEOUT = 5
+
+
+# SO_PEERCRED is missing from the socket module of older Pythons
+SO_PEERCRED = getattr(socket, "SO_PEERCRED", 17)
+
+
+# Returns the uid of the process at the other end of a Unix socket.
+# Abstract sockets have no permissions, so both ends check who they are
+# talking to.
+def peer_uid(connection):
+    credentials = connection.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, struct.calcsize("3i"))
+    pid, uid, gid = struct.unpack("3i", credentials)
+    return uid
+
+
+# Returns the abstract socket address of the banner running on a display
+def address(display=None):
+    if display is None:
+        display = os.environ.get("DISPLAY", "")
+    return "\0classification-banner-%s" % display
+
+
+# Returns the options of a command line, without the configuration file.
+# It only tells which mode to run in; argparse matches "--check=FILE" and
+# abbreviations such as "--upd" the same way the full parse will. Exits
+# with the usage for -h and for invalid arguments.
+def command_line(args):
+    conf_parser, parser = argument_parsers()
+    return parser.parse_known_args(args)[0]
+
+
+# Send a command to the running banner. Returns its reply, or None if no
+# banner of ours is listening. A socket held by another user is never
+# talked to: it could be squatting on the address to keep banners away.
+# Only root can be trusted with it, e.g. a --multi-display supervisor
+# serving the display; the display then has its banner.
+def send(command, display=None, timeout=TIMEOUT):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(address(display))
+        uid = peer_uid(client)
+        if uid != os.getuid():
+            client.close()
+            if uid == 0:
+                return {"error": "this display is served by a banner of the root user"}
+            sys.stderr.write("classification-banner: the command socket of this display belongs to another user\n")
+            return None
+    except socket.error:
+        client.close()
+        return None
+    data = b""
+    try:
+        client.sendall((json.dumps(command) + "\n").encode())
+        client.shutdown(socket.SHUT_WR)
+        while True:
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+    except socket.error:
+        # Includes socket.timeout: the banner accepted but does not answer
+        return {"error": "the running banner did not answer"}
+    finally:
+        client.close()
+    try:
+        return json.loads(data.decode())
+    except ValueError:
+        return {"error": "no reply from the running banner"}
+
+
+# Hand the command line to the banner already running on this display.
+# Returns True if it took over and this process can exit.
+def forward(args):
+    if "DISPLAY" not in os.environ:
+        return False
+    # These must be handled by a process of their own
+    options = command_line(args)
+    if options.multi_display or options.new_instance or options.update or options.check is not None:
+        return False
+    reply = send({"command": "options", "args": args, "cwd": os.getcwd()})
+    if reply is None:
+        return False
+    if reply.get("error"):
+        sys.stderr.write("classification-banner: %s\n" % reply["error"])
+    return True
+
+
+# classification-banner --update: change the classification of the banner
+# running on this display. Returns the exit status.
+def update(args):
+    parser = ArgumentParser(prog="classification-banner --update",
+                            description="Change the classification shown by the running banner")
+    parser.add_argument("--update", action="store_true", help="Required")
+    parser.add_argument("-m", "--message", help="Set the Classification message")
+    parser.add_argument("-f", "--fgcolor", help="Set the Foreground (text) color")
+    parser.add_argument("-b", "--bgcolor", help="Set the Background color")
+    parser.add_argument("--face", help="Font face")
+    parser.add_argument("--size", help="Font size")
+    parser.add_argument("--weight", help="Set the Font weight")
+    parser.add_argument("--display", help="X display of the banner (default $DISPLAY)")
+    options = parser.parse_args(args)
+
+    command = {"command": "update"}
+    for key in LIVE_OPTIONS:
+        if getattr(options, key) is not None:
+            command[key] = getattr(options, key)
+    reply = send(command, options.display)
+    if reply is None:
+        sys.stderr.write("classification-banner: no banner is running on this display\n")
+        return 1
+    if reply.get("error"):
+        sys.stderr.write("classification-banner: %s\n" % reply["error"])
+        return 1
+    return 0
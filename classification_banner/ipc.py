@@ -0,0 +1,122 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+
+import json
+import os
+import socket
+import sys
+
+from classification_banner import mainloop
+from classification_banner.instance import peer_uid
+
+# Seconds a client gets to send its command
+TIMEOUT = 1
+
+# Largest command accepted, in bytes
+MAX_COMMAND = 65536
+
+
+class CommandServer:
+    """Accept commands from other processes on a Unix socket.
+
+    A client sends one JSON object with a "command" key and reads back one
+    JSON object. `handlers` maps command names to callables taking the
+    command and returning the reply. Binding raises socket.error if another
+    process already owns the address.
+
+    Abstract sockets have no permissions, so connections from any other
+    user are closed unanswered. Commands are read without blocking, each
+    connection through a watch of its own, so a slow client cannot hold
+    up the main loop.
+    """
+
+    def __init__(self, address, handlers):
+        self.handlers = handlers
+        self.clients = {}
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.bind(address)
+        except socket.error:
+            self.socket.close()
+            raise
+        self.socket.listen(5)
+        self.source = mainloop.get().io_add_watch(self.socket, self.accept)
+
+    def accept(self, source, condition):
+        try:
+            connection, address = self.socket.accept()
+        except socket.error:
+            return True
+        try:
+            allowed = peer_uid(connection) == os.getuid()
+        except socket.error:
+            allowed = False
+        if not allowed:
+            connection.close()
+            return True
+        connection.setblocking(False)
+        loop = mainloop.get()
+        watch = loop.io_add_watch(connection, self.receive)
+        timer = loop.timeout_add_seconds(TIMEOUT, self.expire, connection)
+        self.clients[connection] = [b"", watch, timer]
+        return True
+
+    # Read what the client has sent so far; answer once the command is complete
+    def receive(self, connection, condition):
+        client = self.clients[connection]
+        try:
+            chunk = connection.recv(4096)
+        except socket.error:
+            chunk = b""
+        client[0] += chunk
+        if chunk and not client[0].endswith(b"\n") and len(client[0]) < MAX_COMMAND:
+            return True
+        data, watch, timer = self.clients.pop(connection)
+        mainloop.get().source_remove(timer)
+        if data:
+            reply = self.dispatch(data)
+            try:
+                # The reply is small enough for the socket buffer
+                connection.sendall((json.dumps(reply) + "\n").encode())
+            except socket.error:
+                pass
+        connection.close()
+        return False
+
+    # Drop a client that did not finish its command in time
+    def expire(self, connection):
+        data, watch, timer = self.clients.pop(connection)
+        mainloop.get().source_remove(watch)
+        connection.close()
+        return False
+
+    # Returns the reply to a command. Whatever a client sends, the main
+    # loop must keep running, so a failing handler is reported to the
+    # client instead of raising.
+    def dispatch(self, data):
+        try:
+            command = json.loads(data.decode())
+        except ValueError:
+            return {"error": "malformed command"}
+        if not isinstance(command, dict):
+            return {"error": "malformed command, expected a JSON object"}
+        handler = self.handlers.get(command.get("command"))
+        if handler is None:
+            return {"error": "unknown command %r" % command.get("command")}
+        try:
+            return handler(command)
+        except Exception as e:
+            sys.stderr.write("classification-banner: command %r failed: %r\n" %
+                             (command.get("command"), e))
+            return {"error": "command failed: %s" % e}
+
+    def destroy(self):
+        loop = mainloop.get()
+        loop.source_remove(self.source)
+        for connection in list(self.clients):
+            data, watch, timer = self.clients.pop(connection)
+            loop.source_remove(watch)
+            loop.source_remove(timer)
+            connection.close()
+        self.socket.close()
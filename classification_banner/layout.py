@@ -0,0 +1,138 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+
+from collections import namedtuple
+
+# A banner window: the monitor it belongs to (0 when spanning), "top" or
+# "bottom", and where it goes. The height follows from the font.
+Window = namedtuple("Window", "monitor position x y width")
+
+# A window covering a whole monitor, "watermark" being the only position
+Area = namedtuple("Area", "monitor position x y width height")
+
+# Options the placement depends on
+LAYOUT_OPTIONS = ["hres", "vres", "spanning", "taskbar_offset", "banner_width",
+                  "show_top", "show_bottom", "watermark"]
+
+# Number of (topology, options) combinations to remember
+CACHE_SIZE = 64
+
+
+# Returns the banner windows for a Topology (see geometry.py)
+def compute_layout(topology, hres=0, vres=0, spanning=False, taskbar_offset=0,
+                   banner_width=0, show_top=True, show_bottom=True, watermark=False):
+    monitors = topology.monitors
+
+    if hres == 0 or vres == 0:
+        if len(monitors) == 1:
+            # Resolution of the only monitor
+            width, height = monitors[0][2:]
+        else:
+            # Size of the whole screen on multi-monitor setups
+            width, height = topology.width, topology.height
+    else:
+        # Resoultion Set Staticly
+        width, height = hres, vres
+
+    if not spanning and len(monitors) > 1:
+        # Subtract the user-defined taskbar_offset from the first monitor's width.
+        # Most Linux WMs report the entire size of the screen but don't mention the space that is always taken by the taskbar.
+        # If spanning is disabled, and both monitors have separate banners, then the first monitor's banner will
+        # overlap into the second's, and if the user is using Gnome, they'll be at different heights, which is ugly.
+        # TODO: If this is ever ported to Python 3, the GTK3 method get_monitor_workarea would be a much less hacky way of doing this.
+        areas = []
+        for i, (x, y, w, h) in enumerate(monitors):
+            if i == 0:
+                w -= taskbar_offset
+            areas.append((i, x, y, w, h))
+    else:
+        areas = [(0, 0, 0, width, height)]
+
+    windows = []
+    if watermark:
+        # The watermark covers each monitor, whatever the banners leave out
+        if len(areas) > 1:
+            covered = [(i, x, y, w, h) for i, (x, y, w, h) in enumerate(monitors)]
+        else:
+            covered = areas
+        for index, x, y, w, h in covered:
+            windows.append(Area(index, "watermark", x, y, w, h))
+    for index, x, y, w, h in areas:
+        # If the banner_width option is set, center the banner on the monitor
+        if banner_width > 0:
+            x = x + w // 2 - banner_width // 2
+            w = banner_width
+        if show_top:
+            windows.append(Window(index, "top", x, y, w))
+        if show_bottom:
+            # The banner height is not known here, so it is placed at the
+            # bottom edge and window managers move it up onto the screen
+            windows.append(Window(index, "bottom", x, y + h, w))
+    return tuple(windows)
+
+
+# Returns the windows of a layout as {monitor: {position: Window}}
+def by_monitor(windows):
+    monitors = {}
+    for window in windows:
+        monitors.setdefault(window.monitor, {})[window.position] = window
+    return monitors
+
+
+# Returns the _NET_WM_STRUT_PARTIAL values that keep other windows clear
+# of a banner `height` pixels tall, or None for a banner on an inner edge.
+# Struts are measured from the edge of the whole screen, so the top banner
+# of a monitor with another monitor above it would reserve all of that
+# monitor too.
+def strut(window, height, topology):
+    start, end = window.x, window.x + window.width - 1
+    for x, y, w, h in topology.monitors:
+        if x <= end and x + w > start:
+            if window.position == "top" and y < window.y:
+                return None
+            if window.position == "bottom" and y + h > window.y:
+                return None
+    if window.position == "top":
+        return [0, 0, window.y + height, 0, 0, 0, 0, 0, start, end, 0, 0]
+    # Bottom banners are laid out at the bottom edge of their monitor
+    return [0, 0, 0, topology.height - window.y + height, 0, 0, 0, 0, 0, 0, start, end]
+
+
+# Compares two layouts as returned by by_monitor(). Returns the monitors
+# that went away, the monitors whose banners moved or changed size, and
+# the monitors that are new. Every backend brings its windows in line
+# with a new layout this way.
+def diff_layout(old, new):
+    removed = [index for index in old if index not in new]
+    moved = [index for index in new if index in old and new[index] != old[index]]
+    added = [index for index in new if index not in old]
+    return removed, moved, added
+
+
+class LayoutEngine:
+    """Memoized compute_layout().
+
+    Layouts are keyed by the topology (which doubles as its own
+    fingerprint) and the options that affect placement.
+    """
+
+    def __init__(self):
+        self.cache = {}
+
+    def layout(self, topology, options):
+        key = (topology, tuple(getattr(options, name) for name in LAYOUT_OPTIONS))
+        windows = self.cache.get(key)
+        if windows is None:
+            if len(self.cache) >= CACHE_SIZE:
+                self.cache.clear()
+            windows = self.cache[key] = compute_layout(topology, *key[1])
+        return windows
+
+    # Evaluate a batch of topologies with the same options
+    def layout_many(self, topologies, options):
+        return [self.layout(topology, options) for topology in topologies]
+
+
+# Shared by every display of the process
+layout_engine = LayoutEngine()
@@ -0,0 +1,46 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+
+
+class Lifecycle:
+    """Track the signal connections and child objects created by an owner.
+
+    Children are anything with a destroy() method (banner windows); they
+    are destroyed in reverse order of creation when the owner closes, and
+    every signal handler connected through connect() is disconnected.
+    """
+
+    def __init__(self):
+        self.connections = []
+        self.children = []
+
+    # Connect a signal handler and remember it for disconnection
+    def connect(self, obj, signal, handler, *args):
+        handler_id = obj.connect(signal, handler, *args)
+        self.connections.append((obj, handler_id))
+        return handler_id
+
+    # Take ownership of a child object
+    def adopt(self, child):
+        self.children.append(child)
+        return child
+
+    # Destroy a single child object
+    def release(self, child):
+        self.children.remove(child)
+        child.destroy()
+
+    # Tear everything down, children first
+    def close(self):
+        while self.children:
+            self.children.pop().destroy()
+        while self.connections:
+            obj, handler_id = self.connections.pop()
+            if obj.handler_is_connected(handler_id):
+                obj.disconnect(handler_id)
+
+    # Returns the number of live objects owned
+    def stats(self):
+        return {"children": len(self.children),
+                "connections": len(self.connections)}
@@ -0,0 +1,137 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+
+import ctypes
+import ctypes.util
+import os
+
+from classification_banner import mainloop
+
+try:
+    import dbus
+    from dbus.mainloop.glib import DBusGMainLoop
+except ImportError:
+    dbus = None
+
+# Screensaver services of the common desktops, all of which emit
+# ActiveChanged(bool) when the screen is locked or unlocked
+SCREENSAVERS = [
+    "org.freedesktop.ScreenSaver",
+    "org.gnome.ScreenSaver",
+    "org.mate.ScreenSaver",
+    "org.cinnamon.ScreenSaver",
+    "org.xfce.ScreenSaver",
+]
+
+# Seconds between MIT-SCREEN-SAVER queries when D-Bus is not available
+POLL_INTERVAL = 5
+
+# XScreenSaverInfo.state
+SCREEN_SAVER_ON = 1
+
+
+class XScreenSaverInfo(ctypes.Structure):
+    _fields_ = [
+        ("window", ctypes.c_ulong),
+        ("state", ctypes.c_int),
+        ("kind", ctypes.c_int),
+        ("til_or_since", ctypes.c_ulong),
+        ("idle", ctypes.c_ulong),
+        ("eventMask", ctypes.c_ulong),
+    ]
+
+
+class ScreenSaverQuery:
+    """Ask the X server's MIT-SCREEN-SAVER extension whether the screen
+    saver is active, over a connection of our own."""
+
+    def __init__(self, display_name=None):
+        xlib = ctypes.util.find_library("X11")
+        xss = ctypes.util.find_library("Xss")
+        if xlib is None or xss is None:
+            raise OSError("libX11 or libXss not found")
+        self.xlib = ctypes.CDLL(xlib)
+        self.xss = ctypes.CDLL(xss)
+        self.xlib.XOpenDisplay.restype = ctypes.c_void_p
+        self.xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self.xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        self.xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        self.xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self.xss.XScreenSaverAllocInfo.restype = ctypes.POINTER(XScreenSaverInfo)
+        self.xss.XScreenSaverQueryInfo.argtypes = [ctypes.c_void_p, ctypes.c_ulong,
+                                                   ctypes.POINTER(XScreenSaverInfo)]
+
+        name = display_name or os.environ.get("DISPLAY", "")
+        self.display = self.xlib.XOpenDisplay(name.encode())
+        if not self.display:
+            raise OSError("cannot open display %s" % name)
+        self.root = self.xlib.XDefaultRootWindow(self.display)
+        self.info = self.xss.XScreenSaverAllocInfo()
+
+    def active(self):
+        if not self.xss.XScreenSaverQueryInfo(self.display, self.root, self.info):
+            return False
+        return self.info.contents.state == SCREEN_SAVER_ON
+
+    def close(self):
+        self.xlib.XFree(self.info)
+        self.xlib.XCloseDisplay(self.display)
+
+
+class LockMonitor:
+    """Call `callback(locked)` whenever the session is locked or unlocked.
+
+    Listens to the ActiveChanged signal of the session's screensaver over
+    D-Bus when dbus-python is installed and the process runs the GLib
+    main loop, and otherwise polls the X server's MIT-SCREEN-SAVER
+    extension. If neither is available the lock state can still be set
+    through the banner's command socket.
+    """
+
+    def __init__(self, callback, display_name=None):
+        self.callback = callback
+        self.locked = False
+        self.matches = []
+        self.query = None
+        self.source = None
+
+        # The D-Bus signals are delivered through the GLib main loop
+        if dbus is not None and mainloop.get().glib:
+            try:
+                bus = dbus.SessionBus(mainloop=DBusGMainLoop())
+                for interface in SCREENSAVERS:
+                    self.matches.append(bus.add_signal_receiver(
+                        self.active_changed, "ActiveChanged", interface))
+                return
+            except dbus.DBusException:
+                self.matches = []
+
+        try:
+            self.query = ScreenSaverQuery(display_name)
+        except OSError:
+            return
+        self.source = mainloop.get().timeout_add_seconds(POLL_INTERVAL, self.poll)
+
+    def active_changed(self, active):
+        self.changed(bool(active))
+
+    def poll(self):
+        self.changed(self.query.active())
+        return True
+
+    def changed(self, locked):
+        if locked != self.locked:
+            self.locked = locked
+            self.callback(locked)
+
+    def destroy(self):
+        for match in self.matches:
+            match.remove()
+        self.matches = []
+        if self.source is not None:
+            mainloop.get().source_remove(self.source)
+            self.source = None
+        if self.query is not None:
+            self.query.close()
+            self.query = None
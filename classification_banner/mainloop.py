@@ -0,0 +1,147 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+# The main loop every part of a banner process schedules its work on:
+# timers, idle callbacks and watches on sockets and file descriptors. The
+# command and metrics sockets, the lock monitor, the system info tick,
+# the configuration watcher and the schedulers only ever talk to get().
+#
+# The GTK backend and the multi-display supervisor run the GLib main
+# loop. The xlib backend installs a SelectLoop with use() before anything
+# is scheduled, so that gobject is never loaded.
+#
+
+import select
+import time
+
+
+class GLibLoop:
+    """The GLib main loop, through gobject."""
+
+    # D-Bus signals can be delivered on this loop (see LockMonitor)
+    glib = True
+
+    def __init__(self):
+        # Imported here so that processes running a SelectLoop do not load it
+        import gobject
+        self.gobject = gobject
+        self.loop = None
+
+    def timeout_add(self, milliseconds, callback, *args):
+        return self.gobject.timeout_add(int(milliseconds), callback, *args)
+
+    def timeout_add_seconds(self, seconds, callback, *args):
+        return self.gobject.timeout_add_seconds(seconds, callback, *args)
+
+    def idle_add(self, callback, *args):
+        return self.gobject.idle_add(callback, *args)
+
+    # Call `callback(source, condition)` whenever `source` (a file
+    # descriptor or an object with a fileno() method) is readable, hung
+    # up or in error
+    def io_add_watch(self, source, callback, *args):
+        gobject = self.gobject
+        return gobject.io_add_watch(source, gobject.IO_IN | gobject.IO_HUP | gobject.IO_ERR,
+                                    callback, *args)
+
+    def source_remove(self, source):
+        self.gobject.source_remove(source)
+
+    def run(self):
+        self.loop = self.gobject.MainLoop()
+        self.loop.run()
+
+    def quit(self):
+        if self.loop is not None:
+            self.loop.quit()
+
+
+class SelectLoop:
+    """A main loop on select(), for processes without GLib.
+
+    Timers, idle callbacks and watches follow the GLib conventions: they
+    are kept for as long as their callback returns True, and the ids they
+    are returned under can be handed to source_remove(). Prepare
+    callbacks run before the loop blocks, e.g. to flush an X connection
+    and handle the events already read from it.
+    """
+
+    glib = False
+
+    def __init__(self):
+        self.timers = {}
+        self.watches = {}
+        self.prepares = []
+        self.last_id = 0
+        self.running = False
+
+    def timeout_add(self, milliseconds, callback, *args):
+        self.last_id += 1
+        self.timers[self.last_id] = [time.time() + milliseconds / 1000.0, milliseconds,
+                                     callback, args]
+        return self.last_id
+
+    def timeout_add_seconds(self, seconds, callback, *args):
+        return self.timeout_add(seconds * 1000, callback, *args)
+
+    def idle_add(self, callback, *args):
+        return self.timeout_add(0, callback, *args)
+
+    # Call `callback(source, None)` whenever `source` is readable
+    def io_add_watch(self, source, callback, *args):
+        self.last_id += 1
+        self.watches[self.last_id] = (source, callback, args)
+        return self.last_id
+
+    def source_remove(self, source):
+        self.timers.pop(source, None)
+        self.watches.pop(source, None)
+
+    def add_prepare(self, callback):
+        self.prepares.append(callback)
+
+    def run(self):
+        self.running = True
+        while self.running:
+            for prepare in self.prepares:
+                prepare()
+            timeout = None
+            if self.timers:
+                due = min(timer[0] for timer in self.timers.values())
+                timeout = max(0, due - time.time())
+            sources = [watch[0] for watch in self.watches.values()]
+            ready = select.select(sources, [], [], timeout)[0]
+
+            for source, watch in sorted(self.watches.items()):
+                if source in self.watches and watch[0] in ready:
+                    if not watch[1](watch[0], None, *watch[2]):
+                        self.watches.pop(source, None)
+
+            now = time.time()
+            for source, timer in sorted(self.timers.items()):
+                if source in self.timers and timer[0] <= now:
+                    if timer[2](*timer[3]):
+                        timer[0] = now + timer[1] / 1000.0
+                    else:
+                        self.timers.pop(source, None)
+
+    def quit(self):
+        self.running = False
+
+
+# The loop of this process, see get()
+loop = None
+
+
+# Returns the main loop of the process: the GLib one, unless a backend
+# installed another with use()
+def get():
+    global loop
+    if loop is None:
+        loop = GLibLoop()
+    return loop
+
+
+def use(new):
+    global loop
+    loop = new
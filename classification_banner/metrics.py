@@ -0,0 +1,116 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+
+import json
+import os
+import socket
+import stat
+
+from classification_banner import mainloop
+
+# Upper bounds (milliseconds) of the relayout latency histogram buckets
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+# Returns the resident set size of this process in KiB
+def rss():
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+    except (IOError, OSError):
+        return 0
+    return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+# Remove a Unix socket left behind at `path`. Raises socket.error if
+# something other than a socket is there, e.g. a mistyped file name.
+def remove_socket(path):
+    try:
+        mode = os.lstat(path).st_mode
+    except OSError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise socket.error("%s exists and is not a socket" % path)
+    os.unlink(path)
+
+
+class RelayoutMetrics:
+    """Relayout count, last duration and a latency histogram."""
+
+    def __init__(self):
+        self.relayouts = 0
+        self.last_ms = 0.0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        self.relayouts += 1
+        self.last_ms = ms
+        for i, bound in enumerate(BUCKETS):
+            if ms <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def snapshot(self):
+        histogram = dict(("le_%d" % bound, count)
+                         for bound, count in zip(BUCKETS, self.histogram))
+        histogram["inf"] = self.histogram[-1]
+        return {
+            "relayouts": self.relayouts,
+            "last_relayout_ms": round(self.last_ms, 3),
+            "relayout_histogram_ms": histogram,
+        }
+
+
+class MetricsServer:
+    """Answer every connection on a local Unix socket with a JSON snapshot.
+
+    `snapshot` is called for each client and returns a dict; the process
+    RSS is added to it. A path starting with "@" is bound in the abstract
+    namespace, so nothing is left behind on the file system. A socket
+    left at the path by an earlier banner is replaced, anything else is
+    left alone. Binding raises socket.error if the address is taken or
+    the path is not a socket.
+    """
+
+    def __init__(self, path, snapshot):
+        self.path = path
+        self.snapshot = snapshot
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            if path.startswith("@"):
+                self.socket.bind("\0" + path[1:])
+            else:
+                remove_socket(path)
+                self.socket.bind(path)
+        except socket.error:
+            self.socket.close()
+            raise
+        self.socket.listen(5)
+        self.source = mainloop.get().io_add_watch(self.socket, self.accept)
+
+    def accept(self, source, condition):
+        try:
+            connection, address = self.socket.accept()
+        except socket.error:
+            return True
+        try:
+            data = self.snapshot()
+            data["rss_kib"] = rss()
+            connection.sendall((json.dumps(data, sort_keys=True) + "\n").encode())
+        except socket.error:
+            pass
+        connection.close()
+        return True
+
+    def destroy(self):
+        mainloop.get().source_remove(self.source)
+        self.socket.close()
+        if not self.path.startswith("@"):
+            try:
+                remove_socket(self.path)
+            except socket.error:
+                pass
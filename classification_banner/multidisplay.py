@@ -0,0 +1,535 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+# --multi-display: one supervisor serving the banners of every session on
+# a terminal server. The supervisor parses the configuration, watches it
+# and owns the supervisor command socket and the metrics socket, but
+# never loads GTK or talks to an X server.
+#
+# Before its main loop has any sources, the supervisor forks a zygote
+# that imports GTK and the banner modules once, without a display. Each
+# display is served by a child forked from the zygote, so the pages of
+# the interpreter and of GTK are shared copy-on-write between all of
+# them. A child opens its display, runs an ordinary DisplayBanner and
+# binds the command socket of its display, as a banner of its own would.
+# GDK exits the process when its X connection breaks, so a session that
+# logs out only takes its own child with it.
+#
+#   supervisor --commands--> zygote --options--> one child per display
+#              <--events----
+#
+# Every pipe carries one JSON object per line.
+#
+
+import errno
+import fcntl
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+import warnings
+from argparse import Namespace
+
+from classification_banner import instance, mainloop, tracing
+from classification_banner.check import check_color
+from classification_banner.config import live_values
+from classification_banner.ipc import CommandServer
+from classification_banner.metrics import MetricsServer
+from classification_banner.scheduler import UpdateQueue
+from classification_banner.watcher import ConfigWatcher
+
+# Where the X servers of the sessions have their sockets, and how often
+# (seconds) to look for sessions
+X11_SOCKET_DIR = "/tmp/.X11-unix"
+SCAN_INTERVAL = 5
+
+# Seconds before a display whose child died is tried again; doubled on
+# every failure in a row, up to RESTART_MAX
+RESTART_DELAY = 1
+RESTART_MAX = 60
+
+# A child that ran this long (seconds) is not counted as failing
+STABLE_TIME = 30
+
+# How often (seconds) the zygote looks for children that exited
+REAP_INTERVAL = 0.5
+
+# Seconds a child gets to answer the supervisor's metrics request
+METRICS_TIMEOUT = 0.5
+
+# The supervisor's command socket is instance.address(SUPERVISOR):
+#   classification-banner --update --display multi-display -m SECRET
+SUPERVISOR = "multi-display"
+
+
+# Returns the names of the X displays with a local server socket
+def local_displays():
+    try:
+        entries = os.listdir(X11_SOCKET_DIR)
+    except OSError:
+        return []
+    return [":" + entry[1:] for entry in sorted(entries)
+            if entry.startswith("X") and entry[1:].isdigit()]
+
+
+# Returns the line of JSON carrying a message
+def encode(message):
+    return (json.dumps(message, sort_keys=True) + "\n").encode()
+
+
+def namespace(values):
+    return Namespace(**dict((str(key), value) for key, value in values.items()))
+
+
+# Write a whole message to a blocking pipe
+def write_message(fd, message):
+    data = encode(message)
+    while data:
+        data = data[os.write(fd, data):]
+
+
+class Pipe:
+    """The reading end of a pipe carrying one JSON object per line."""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.data = b""
+
+    # Returns the messages that arrived complete so far. Raises EOFError
+    # once the other end is closed.
+    def read(self):
+        chunk = os.read(self.fd, 65536)
+        if not chunk:
+            raise EOFError()
+        self.data += chunk
+        lines = self.data.split(b"\n")
+        self.data = lines.pop()
+        return [json.loads(line.decode()) for line in lines]
+
+
+class Child:
+    """The process serving one display, as the supervisor sees it."""
+
+    def __init__(self, name, failures=0):
+        self.name = name
+        self.failures = failures
+        self.started = time.time()
+        # Known once the zygote reports it
+        self.pid = None
+
+
+class Zygote:
+    """The supervisor's end of the zygote (see the top of this file).
+
+    Forked when created, which must happen before the supervisor's main
+    loop has any sources, or the children would inherit them. `callback`
+    gets every event the zygote reports.
+    """
+
+    def __init__(self, callback):
+        commands, self.commands = os.pipe()
+        events, zygote_events = os.pipe()
+        self.pid = os.fork()
+        if self.pid == 0:
+            os.close(self.commands)
+            os.close(events)
+            status = 1
+            try:
+                status = zygote(commands, zygote_events)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                os._exit(status)
+        os.close(commands)
+        os.close(zygote_events)
+        self.callback = callback
+        self.events = Pipe(events)
+        self.source = mainloop.get().io_add_watch(events, self.receive)
+
+    def send(self, message):
+        try:
+            write_message(self.commands, message)
+        except OSError:
+            # The zygote is gone, which receive() reports
+            pass
+
+    def start(self, name, options):
+        self.send({"command": "start", "display": name, "options": vars(options)})
+
+    def stop(self, name):
+        self.send({"command": "stop", "display": name})
+
+    def apply(self, name, options):
+        self.send({"command": "options", "display": name, "options": vars(options)})
+
+    def receive(self, source, condition):
+        try:
+            messages = self.events.read()
+        except (EOFError, OSError):
+            self.source = None
+            self.callback({"event": "zygote exited"})
+            return False
+        for message in messages:
+            self.callback(message)
+        return True
+
+    # Closing the pipe tells the zygote to stop every child and exit
+    def close(self):
+        if self.source is not None:
+            mainloop.get().source_remove(self.source)
+            self.source = None
+        os.close(self.commands)
+        os.close(self.events.fd)
+        try:
+            os.waitpid(self.pid, 0)
+        except OSError:
+            pass
+
+
+class MultiDisplayBanner:
+    """Serve the banners of many X displays from one supervisor.
+
+    Meant for terminal servers (XRDP, VNC) where every session has its own
+    X display. The configuration is parsed once and handed to one child
+    process per display. Displays are either given explicitly or
+    discovered from the X server sockets. Children are started and
+    stopped as sessions come and go, and restarted with a back-off when
+    they die while their display is still there.
+    """
+
+    def __init__(self, configuration, displays=None):
+        # Forked first, while the main loop has no sources yet
+        self.zygote = Zygote(self.event)
+        self.configuration = configuration
+        self.names = displays
+        self.children = {}
+        self.retry = {}
+        self.restarts = 0
+        self.watcher = ConfigWatcher(configuration.path, self.reload)
+        self.updates = UpdateQueue(self.apply_update)
+        self.scan()
+        self.scan_source = mainloop.get().timeout_add_seconds(SCAN_INTERVAL, self.scan)
+
+    # Serve new displays and stop serving the ones that went away
+    def scan(self):
+        names = self.names or local_displays()
+        now = time.time()
+        for name in names:
+            if name not in self.children and self.retry.get(name, (0, 0))[0] <= now:
+                self.attach(name, self.retry.pop(name, (0, 0))[1])
+        for name in list(self.children):
+            if name not in names:
+                self.detach(name)
+        for name in list(self.retry):
+            if name not in names:
+                del self.retry[name]
+        return True
+
+    def attach(self, name, failures=0):
+        self.children[name] = Child(name, failures)
+        self.zygote.start(name, self.configuration.options)
+
+    def detach(self, name):
+        del self.children[name]
+        self.zygote.stop(name)
+
+    # An event reported by the zygote
+    def event(self, message):
+        kind = message["event"]
+        if kind == "zygote exited":
+            # Nothing can be served without it
+            sys.stderr.write("classification-banner: the multi-display zygote exited\n")
+            mainloop.get().quit()
+            return
+        child = self.children.get(message["display"])
+        if child is None:
+            return
+        if kind == "started" and child.pid is None:
+            child.pid = message["pid"]
+        elif kind == "exited" and child.pid == message["pid"]:
+            self.exited(child)
+
+    # A child exited: its session ended, its X connection broke, or it
+    # could not connect (yet). Try again later if the display is still there.
+    def exited(self, child):
+        del self.children[child.name]
+        if time.time() - child.started >= STABLE_TIME:
+            failures = 0
+        else:
+            failures = child.failures + 1
+        delay = min(RESTART_DELAY * 2 ** failures, RESTART_MAX)
+        self.retry[child.name] = (time.time() + delay, failures)
+        self.restarts += 1
+        mainloop.get().timeout_add_seconds(delay, self.scan_once)
+
+    def scan_once(self):
+        self.scan()
+        return False
+
+    # Returns the live counters of the supervisor (see MetricsServer),
+    # with the counters every child reports for its display
+    def snapshot(self):
+        displays = {}
+        for name, child in self.children.items():
+            data = {"pid": child.pid, "failures": child.failures}
+            reply = None
+            if child.pid is not None:
+                reply = instance.send({"command": "metrics"}, name, METRICS_TIMEOUT)
+            if reply is None or reply.get("error"):
+                data["error"] = "no answer from the banner of this display"
+            else:
+                data.update(reply)
+            displays[name] = data
+        return {
+            "displays": displays,
+            "restarts": self.restarts,
+            "config_reloads": self.configuration.reloads,
+            "updates": self.updates.pushed,
+            "updates_applied": self.updates.applied,
+        }
+
+    # Push a changed configuration file to every display
+    def reload(self):
+        options = self.configuration.reload()
+        if options is not None:
+            for name in self.children:
+                self.zygote.apply(name, options)
+
+    # Change the classification on every display ("update" command, also
+    # relayed by the children from the command sockets of their displays)
+    def update(self, command):
+        values, error = live_values(command)
+        if error is None:
+            for key in ("fgcolor", "bgcolor"):
+                if key in values and error is None:
+                    error = check_color(values[key])
+                    if error:
+                        error = "%s: %s" % (key, error)
+        if error:
+            return {"error": error}
+        self.updates.push(values)
+        return {}
+
+    def apply_update(self, values):
+        options = self.configuration.override(values)
+        for name in self.children:
+            self.zygote.apply(name, options)
+
+    def close(self):
+        mainloop.get().source_remove(self.scan_source)
+        self.watcher.destroy()
+        self.updates.cancel()
+        self.children = {}
+        self.zygote.close()
+
+
+# Entry point of the zygote. Returns the exit status once the supervisor
+# closed the command pipe and every child exited.
+def zygote(commands, events):
+    # Load GTK without connecting to any display, which it warns about
+    os.environ.pop("DISPLAY", None)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        import gtk
+    from classification_banner import display
+
+    # Display name -> (pid, options pipe) of the child serving it, and
+    # pid -> display name of every child not reaped yet
+    children = {}
+    pids = {}
+    pipe = Pipe(commands)
+    running = True
+    while running or pids:
+        ready = select.select([commands] if running else [], [], [], REAP_INTERVAL)[0]
+        if ready:
+            try:
+                messages = pipe.read()
+            except EOFError:
+                # A child exits once its options pipe is closed
+                running = False
+                messages = [{"command": "stop", "display": name} for name in children]
+            for message in messages:
+                name = message["display"]
+                if message["command"] == "start" and name not in children:
+                    inherited = [commands, events] + [fd for pid, fd in children.values()]
+                    children[name] = fork_child(name, namespace(message["options"]), inherited)
+                    pids[children[name][0]] = name
+                    report(events, {"event": "started", "display": name,
+                                    "pid": children[name][0]})
+                elif message["command"] == "options" and name in children:
+                    relay(children[name], message["options"])
+                elif message["command"] == "stop" and name in children:
+                    os.close(children.pop(name)[1])
+
+        # Reap the children that exited
+        while pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError:
+                pids = {}
+                break
+            if pid == 0:
+                break
+            name = pids.pop(pid, None)
+            if name is None:
+                continue
+            if name in children and children[name][0] == pid:
+                os.close(children.pop(name)[1])
+            report(events, {"event": "exited", "display": name, "pid": pid, "status": status})
+    return 0
+
+
+# Tell the supervisor about a child, unless it is gone already
+def report(events, message):
+    try:
+        write_message(events, message)
+    except OSError:
+        pass
+
+
+# Hand a child a new set of options. A child that does not read them is
+# stuck: it is terminated, and restarted by the supervisor.
+def relay(child, options):
+    pid, fd = child
+    data = encode({"options": options})
+    try:
+        written = os.write(fd, data)
+    except OSError as e:
+        if e.errno == errno.EPIPE:
+            # Exited already, and reaped soon
+            return
+        written = 0
+    if written < len(data):
+        sys.stderr.write("classification-banner: banner process %d does not take new options, restarting it\n" % pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+
+# Fork the child serving a display. `inherited` are file descriptors of
+# the zygote the child must not keep. Returns (pid, options pipe).
+def fork_child(name, options, inherited):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(write_fd)
+        for fd in inherited:
+            os.close(fd)
+        status = 1
+        try:
+            status = child(name, options, read_fd)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            os._exit(status)
+    os.close(read_fd)
+    flags = fcntl.fcntl(write_fd, fcntl.F_GETFL)
+    fcntl.fcntl(write_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    return pid, write_fd
+
+
+class ReceivedConfiguration:
+    """Stands in for Configuration in a child: the options come from the
+    supervisor, which does all the parsing and watching."""
+
+    def __init__(self, options):
+        self.options = options
+        self.path = None
+        self.reloads = 0
+
+
+# Entry point of a child forked from the zygote. Returns the exit status
+# once the supervisor stopped serving the display.
+def child(name, options, fd):
+    trace = tracing.StartupTrace(time.time())
+    os.environ["DISPLAY"] = name
+    tracing.forked()
+    import gtk
+    try:
+        display = gtk.gdk.Display(name)
+    except RuntimeError as e:
+        sys.stderr.write("classification-banner: cannot open display %s: %s\n" % (name, e))
+        return 1
+    gtk.gdk.display_manager_get().set_default_display(display)
+    trace.mark("open display")
+    from classification_banner.banner import DisplayBanner, GtkBackend
+    from classification_banner.lock import LockMonitor
+
+    configuration = ReceivedConfiguration(options)
+    tracing.start()
+    run = DisplayBanner(GtkBackend(), configuration, trace, watch_config=False)
+    if options.power_save:
+        lock = LockMonitor(run.set_locked, name)
+
+    # The command socket of the display, bound as a banner of its own
+    # would. Options are the supervisor's business; updates are relayed
+    # to it, so that every display changes together.
+    def forwarded(command):
+        return {"error": "this display is served by classification-banner --multi-display, "
+                         "change its configuration file instead"}
+
+    def update(command):
+        reply = instance.send(command, SUPERVISOR)
+        if reply is None:
+            return {"error": "the multi-display supervisor does not answer"}
+        return reply
+
+    handlers = {
+        "options": forwarded,
+        "update": update,
+        "lock": run.lock,
+        "metrics": lambda command: run.snapshot(),
+    }
+    try:
+        server = CommandServer(instance.address(name), handlers)
+    except socket.error:
+        sys.stderr.write("classification-banner: another banner owns the command socket of %s\n" % name)
+
+    loop = mainloop.get()
+    pipe = Pipe(fd)
+
+    def receive(source, condition):
+        try:
+            messages = pipe.read()
+        except (EOFError, OSError):
+            # The supervisor is gone or stopped serving this display
+            loop.quit()
+            return False
+        if messages:
+            options = namespace(messages[-1]["options"])
+            if not run.apply(options):
+                configuration.options = options
+                configuration.reloads += 1
+        return True
+    loop.io_add_watch(fd, receive)
+    loop.run()
+    return 0
+
+
+def main(configuration):
+    if configuration.options.backend == "xlib":
+        sys.stderr.write("classification-banner: multi-display mode draws every display with GTK\n")
+    displays = None
+    if configuration.options.displays:
+        displays = configuration.options.displays.split(",")
+    run = MultiDisplayBanner(configuration, displays)
+    try:
+        server = CommandServer(instance.address(SUPERVISOR), {"update": run.update})
+    except socket.error:
+        sys.stderr.write("classification-banner: another supervisor owns the command socket, live updates are disabled\n")
+    if configuration.options.metrics_socket:
+        try:
+            metrics = MetricsServer(configuration.options.metrics_socket, run.snapshot)
+        except socket.error as e:
+            sys.stderr.write("classification-banner: metrics are disabled, cannot bind %s: %s\n" %
+                             (configuration.options.metrics_socket, e))
+    try:
+        mainloop.get().run()
+    except KeyboardInterrupt:
+        pass
+    run.close()
@@ -0,0 +1,165 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+
+import math
+
+import cairo
+import gtk
+import pangocairo
+
+# Number of rendered banners to keep around (one per distinct monitor
+# width is typical)
+CACHE_SIZE = 8
+
+# Space around the text, in pixels
+PADDING = 2
+SIDE_PADDING = 20
+
+# Watermark text size (points), the space between two copies of it
+# (pixels) and how far it is turned (degrees, counterclockwise)
+WATERMARK_SIZE = 36
+WATERMARK_SPACING = 160
+WATERMARK_ANGLE = 30
+
+# 4x4 ordered dither (Bayer) matrix: a pixel is kept when its entry is
+# below the opacity times 16
+DITHER = [[0, 8, 2, 10],
+          [12, 4, 14, 6],
+          [3, 11, 1, 9],
+          [15, 7, 13, 5]]
+
+
+# Returns a cairo (r, g, b) tuple for a GTK color specification
+def rgb(color):
+    color = gtk.gdk.color_parse(color)
+    return (color.red / 65535.0, color.green / 65535.0, color.blue / 65535.0)
+
+
+class TextSurfaceCache:
+    """Whole banners pre-rendered into image surfaces.
+
+    A surface holds the background and every piece of text of a banner
+    and is keyed by everything that goes into it, so the top and bottom
+    windows of all monitors with the same width share one surface and
+    redrawing a window is a single paint.
+    """
+
+    def __init__(self):
+        self.surfaces = {}
+
+    # Returns the surface for a banner, rendering it if needed. `texts` are
+    # (markup, alignment) pairs with alignment "left", "center" or "right".
+    def get(self, texts, fgcolor, bgcolor, face, size, weight, width):
+        key = (texts, fgcolor, bgcolor, face, size, weight, width)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            if len(self.surfaces) >= CACHE_SIZE:
+                self.surfaces.clear()
+            surface = self.surfaces[key] = self.render(texts, bgcolor, width)
+        return surface
+
+    def render(self, texts, bgcolor, width):
+        # Measure the text first to find out how tall the banner is
+        scratch = pangocairo.CairoContext(cairo.Context(
+            cairo.ImageSurface(cairo.FORMAT_RGB24, 1, 1)))
+        layouts = []
+        for markup, alignment in texts:
+            layout = scratch.create_layout()
+            layout.set_markup(markup)
+            layouts.append((layout, alignment))
+        height = max([layout.get_pixel_size()[1] for layout, alignment in layouts] + [1])
+        height += 2 * PADDING
+
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, max(width, 1), height)
+        context = pangocairo.CairoContext(cairo.Context(surface))
+        context.set_source_rgb(*rgb(bgcolor))
+        context.paint()
+        for layout, alignment in layouts:
+            text_width, text_height = layout.get_pixel_size()
+            if alignment == "left":
+                x = SIDE_PADDING
+            elif alignment == "right":
+                x = width - text_width - SIDE_PADDING
+            else:
+                x = (width - text_width) // 2
+            context.move_to(x, (height - text_height) // 2)
+            context.update_layout(layout)
+            context.show_layout(layout)
+        surface.flush()
+        return surface
+
+
+class WatermarkTiles:
+    """The watermark text rendered once into a repeating pattern.
+
+    The tile holds one copy of the text, upright and in full color on a
+    transparent background. The pattern repeats it and turns the grid by
+    WATERMARK_ANGLE, so the text runs diagonally without ever being cut
+    at a tile edge. Every watermark window of the process paints from the
+    same pattern.
+    """
+
+    def __init__(self):
+        self.patterns = {}
+
+    # Returns the pattern for a watermark, rendering its tile if needed
+    def get(self, message, color, face, weight):
+        key = (message, color, face, weight)
+        pattern = self.patterns.get(key)
+        if pattern is None:
+            if len(self.patterns) >= CACHE_SIZE:
+                self.patterns.clear()
+            pattern = self.patterns[key] = self.render(message, color, face, weight)
+        return pattern
+
+    def render(self, message, color, face, weight):
+        scratch = pangocairo.CairoContext(cairo.Context(
+            cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1)))
+        layout = scratch.create_layout()
+        layout.set_markup("<span font_family='%s' weight='%s' size='%d'>%s</span>" %
+                          (face, weight, WATERMARK_SIZE * 1024, message))
+        text_width, text_height = layout.get_pixel_size()
+
+        # Every other row is shifted by half a tile, like bricks
+        width = text_width + WATERMARK_SPACING
+        height = text_height + WATERMARK_SPACING
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, max(width, 1), 2 * max(height, 1))
+        context = pangocairo.CairoContext(cairo.Context(surface))
+        context.set_source_rgb(*rgb(color))
+        for x, y in [(0, 0), (width // 2, height), (width // 2 - width, height)]:
+            context.move_to(x + WATERMARK_SPACING // 2, y + WATERMARK_SPACING // 2)
+            context.update_layout(layout)
+            context.show_layout(layout)
+        surface.flush()
+
+        pattern = cairo.SurfacePattern(surface)
+        pattern.set_extend(cairo.EXTEND_REPEAT)
+        matrix = cairo.Matrix()
+        matrix.rotate(math.radians(WATERMARK_ANGLE))
+        pattern.set_matrix(matrix)
+        return pattern
+
+
+# Returns a repeating pattern, opaque for about `opacity` of its pixels
+# and transparent for the rest, spread out evenly
+def dither_pattern(opacity):
+    surface = cairo.ImageSurface(cairo.FORMAT_A8, 4, 4)
+    context = cairo.Context(surface)
+    # At least one pixel in 16, so that the watermark never disappears
+    level = max(1, int(round(opacity * 16)))
+    for y, row in enumerate(DITHER):
+        for x, entry in enumerate(row):
+            if entry < level:
+                context.rectangle(x, y, 1, 1)
+    context.fill()
+    surface.flush()
+    pattern = cairo.SurfacePattern(surface)
+    pattern.set_extend(cairo.EXTEND_REPEAT)
+    pattern.set_filter(cairo.FILTER_NEAREST)
+    return pattern
+
+
+# Shared by every banner window of the process
+text_surfaces = TextSurfaceCache()
+watermark_tiles = WatermarkTiles()
@@ -0,0 +1,117 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+
+import time
+
+from classification_banner import mainloop
+from classification_banner.config import RELAYOUT_DELAY
+from classification_banner.tracing import traced
+
+# Milliseconds without a new update before the pending ones are applied
+UPDATE_DELAY = 100
+
+# Milliseconds an update may be held back by a steady stream of newer ones
+UPDATE_MAX_DELAY = 1000
+
+
+class RelayoutScheduler:
+    """Coalesce bursts of screen-change notifications into one relayout.
+
+    Every notification (re)starts a quiet period timer; the callback runs
+    once the screen has been quiet for `delay` milliseconds.
+    """
+
+    def __init__(self, callback, delay=RELAYOUT_DELAY):
+        self.callback = callback
+        self.delay = delay
+        self.timer = None
+        self.paused = False
+
+        # Statistics
+        self.events = 0
+        self.coalesced = 0
+        self.relayouts = 0
+
+    # Screen-change signal handler
+    @traced("screen changed")
+    def notify(self, *args):
+        self.events += 1
+        if self.paused:
+            # Left to whoever resumes the scheduler
+            self.coalesced += 1
+            return
+        if self.timer is not None:
+            mainloop.get().source_remove(self.timer)
+            self.coalesced += 1
+        self.timer = mainloop.get().timeout_add(self.delay, self.run)
+
+    # Drop a pending relayout
+    def cancel(self):
+        if self.timer is not None:
+            mainloop.get().source_remove(self.timer)
+            self.timer = None
+
+    # Hold relayouts back, e.g. while the session is locked
+    def pause(self):
+        self.cancel()
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def run(self):
+        self.timer = None
+        self.relayouts += 1
+        self.callback()
+        return False
+
+
+class UpdateQueue:
+    """Merge option updates that arrive in quick succession.
+
+    Every update is a connection of its own, so they rarely arrive in the
+    same main loop iteration. Like RelayoutScheduler, every push
+    (re)starts a quiet period timer; the values pushed until then are
+    merged, later values winning, and handed to the callback in one go,
+    so only the latest state is ever rendered. A steady stream of updates
+    is applied at least every `max_delay` milliseconds.
+    """
+
+    def __init__(self, callback, delay=UPDATE_DELAY, max_delay=UPDATE_MAX_DELAY):
+        self.callback = callback
+        self.delay = delay
+        self.max_delay = max_delay
+        self.values = {}
+        self.source = None
+        self.first = None
+
+        # Statistics
+        self.pushed = 0
+        self.applied = 0
+
+    def push(self, values):
+        self.pushed += 1
+        self.values.update(values)
+        now = time.time()
+        if self.source is None:
+            self.first = now
+        else:
+            mainloop.get().source_remove(self.source)
+        waited = (now - self.first) * 1000
+        delay = max(0, min(self.delay, self.max_delay - waited))
+        self.source = mainloop.get().timeout_add(int(delay), self.run)
+
+    # Drop pending updates
+    def cancel(self):
+        if self.source is not None:
+            mainloop.get().source_remove(self.source)
+            self.source = None
+        self.values = {}
+
+    def run(self):
+        self.source = None
+        values, self.values = self.values, {}
+        self.applied += 1
+        self.callback(values)
+        return False
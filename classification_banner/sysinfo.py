@@ -0,0 +1,202 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+
+import os
+import socket
+import string
+import time
+from xml.sax.saxutils import escape
+
+from classification_banner import mainloop
+
+START_TIME = time.time()
+
+# Default seconds between two refreshes of the live fields
+INFO_INTERVAL = 1
+
+
+# Returns Username
+def get_user():
+    try:
+        return os.getlogin()
+    except:
+        return ''
+
+
+# Returns Hostname
+def get_host():
+    return socket.gethostname().split('.')[0]
+
+
+# Returns the local time of day
+def get_clock():
+    return time.strftime("%H:%M")
+
+
+def get_date():
+    return time.strftime("%Y-%m-%d")
+
+
+# Returns how long the session has been running (the banner starts with it)
+def get_session_age():
+    minutes = int(time.time() - START_TIME) // 60
+    return "%d:%02d" % (minutes // 60, minutes % 60)
+
+
+# Returns the address of the interface holding the default route
+def get_ip():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # Connecting a UDP socket sends nothing, it only picks a route
+        probe.connect(("192.0.2.1", 9))
+        return probe.getsockname()[0]
+    except socket.error:
+        return ''
+    finally:
+        probe.close()
+
+
+# Fields available to the system info templates: name -> (function, TTL).
+# A TTL of None means the value never changes, 0 that it is looked up on
+# every tick, anything else is the number of seconds it is cached for.
+FIELDS = {
+    "user": (get_user, None),
+    "host": (get_host, None),
+    "ip": (get_ip, 60),
+    "clock": (get_clock, 0),
+    "date": (get_date, 0),
+    "session_age": (get_session_age, 0),
+}
+
+
+# Returns the names of the fields used by a template such as "{user}@{host}"
+def template_fields(template):
+    return [name for text, name, spec, conversion in string.Formatter().parse(template)
+            if name]
+
+
+class SystemInfo:
+    """Live text for the system info part of every banner window.
+
+    Banners subscribe with their templates. One shared tick looks every
+    field up at most once per interval, or once per TTL for expensive
+    ones, formats each distinct template once and only calls back the
+    banners whose text changed. The tick only runs while some subscribed
+    template uses a field that can change.
+    """
+
+    def __init__(self, interval=INFO_INTERVAL):
+        self.interval = interval
+        self.cache = {}
+        self.texts = {}
+        self.subscribers = []
+        self.source = None
+        self.paused = False
+        self.ticks = 0
+
+    # Returns the current text of each template
+    def get(self, templates):
+        missing = [template for template in templates if template not in self.texts]
+        values = self.values(missing, time.time())
+        for template in missing:
+            self.texts[template] = self.format(template, values)
+        return [self.texts[template] for template in templates]
+
+    # Call `callback(*texts)` whenever the text of one of the templates changes
+    def subscribe(self, callback, templates):
+        self.subscribers.append((callback, tuple(templates)))
+        self.schedule()
+
+    def unsubscribe(self, callback):
+        self.subscribers = [(subscriber, templates)
+                            for subscriber, templates in self.subscribers
+                            if subscriber != callback]
+        if not self.subscribers:
+            self.texts = {}
+        self.schedule()
+
+    def set_interval(self, interval):
+        if interval != self.interval:
+            self.interval = interval
+            self.stop()
+            self.schedule()
+
+    # Stop ticking, e.g. while the session is locked
+    def pause(self):
+        self.paused = True
+        self.stop()
+
+    def resume(self):
+        self.paused = False
+        if self.live():
+            self.tick()
+        self.schedule()
+
+    # Returns whether any subscribed template uses a field that can change
+    def live(self):
+        for callback, templates in self.subscribers:
+            for template in templates:
+                for name in template_fields(template):
+                    if name in FIELDS and FIELDS[name][1] is not None:
+                        return True
+        return False
+
+    def schedule(self):
+        if self.paused or not self.live():
+            self.stop()
+        elif self.source is None:
+            self.source = mainloop.get().timeout_add_seconds(self.interval, self.tick)
+
+    def stop(self):
+        if self.source is not None:
+            mainloop.get().source_remove(self.source)
+            self.source = None
+
+    def tick(self):
+        self.ticks += 1
+        templates = set()
+        for callback, subscribed in self.subscribers:
+            templates.update(subscribed)
+        values = self.values(templates, time.time())
+
+        changed = set()
+        for template in templates:
+            text = self.format(template, values)
+            if text != self.texts.get(template):
+                self.texts[template] = text
+                changed.add(template)
+        if changed:
+            for callback, subscribed in list(self.subscribers):
+                if changed.intersection(subscribed):
+                    callback(*[self.texts[template] for template in subscribed])
+        return True
+
+    # Returns the value of every known field used by the templates
+    def values(self, templates, now):
+        values = {}
+        for template in templates:
+            for name in template_fields(template):
+                if name in FIELDS and name not in values:
+                    values[name] = self.lookup(name, now)
+        return values
+
+    def lookup(self, name, now):
+        function, ttl = FIELDS[name]
+        cached = self.cache.get(name)
+        if cached is not None and (cached[0] is None or now < cached[0]):
+            return cached[1]
+        value = escape(function())
+        self.cache[name] = (None if ttl is None else now + ttl, value)
+        return value
+
+    # Templates with unknown fields are shown as they are
+    def format(self, template, values):
+        try:
+            return template.format(**values)
+        except (KeyError, IndexError, ValueError):
+            return escape(template)
+
+
+# Shared by every banner window of the process
+live_info = SystemInfo()
@@ -0,0 +1,181 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+# Opt-in phase tracing. With CLASSIFICATION_BANNER_TRACE set to a file name
+# (where "{pid}" is replaced by the process id) every traced phase is
+# written to it as a Chrome trace event, ready for chrome://tracing or
+# ui.perfetto.dev. Tracing is decided once at import time: when it is off
+# @traced returns the function untouched and span() a shared no-op, so
+# nothing is measured or allocated.
+#
+# The file is only created by a process that goes on to show banners
+# (see start()). A second invocation handing its options over, --update
+# or --check never touch it, so they cannot truncate the trace of the
+# banner that is already running.
+#
+
+import atexit
+import json
+import os
+import sys
+import time
+
+TRACE_VARIABLE = "CLASSIFICATION_BANNER_TRACE"
+
+# Events kept in memory until the trace file is opened
+MAX_PENDING = 1000
+
+
+class Tracer:
+    """Append complete ("X") events to a trace file as they finish.
+
+    Events are written and flushed one by one in the JSON array format,
+    whose closing bracket is optional, so a banner that is killed still
+    leaves a usable trace. Until start() they are held in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.file = None
+        self.pending = []
+
+    # Create the trace file and write what was recorded so far
+    def start(self):
+        if self.file is not None:
+            return
+        self.file = open(self.path.replace("{pid}", str(self.pid)), "w")
+        self.file.write("[\n")
+        atexit.register(self.close)
+        self.event({"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0,
+                    "args": {"name": "classification-banner"}})
+        pending, self.pending = self.pending, []
+        for event in pending:
+            self.event(event)
+
+    def event(self, event):
+        if self.file is None:
+            if len(self.pending) < MAX_PENDING:
+                self.pending.append(event)
+            return
+        self.file.write(json.dumps(event) + ",\n")
+        self.file.flush()
+
+    def complete(self, name, start, end, args=None):
+        self.event({"name": name, "cat": "banner", "ph": "X", "pid": self.pid, "tid": 0,
+                    "ts": int(start * 1000000), "dur": int((end - start) * 1000000),
+                    "args": args or {}})
+
+    def close(self):
+        if self.file is not None and not self.file.closed:
+            self.file.write(json.dumps({"name": "exit", "ph": "i", "s": "p", "pid": self.pid,
+                                        "tid": 0, "ts": int(time.time() * 1000000)}))
+            self.file.write("\n]\n")
+            self.file.close()
+
+
+class Span:
+    """Time a block of code: with span("geometry"): ..."""
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        tracer.complete(self.name, self.start, time.time(), self.args)
+        return False
+
+
+class NullSpan:
+    """What span() hands out while tracing is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+tracer = None
+if os.environ.get(TRACE_VARIABLE):
+    tracer = Tracer(os.environ[TRACE_VARIABLE])
+
+
+# Called by a process once it is going to show banners
+def start():
+    if tracer is not None:
+        tracer.start()
+
+
+# Called by a forked child, which writes a trace of its own: the events
+# of its parent are dropped and the pid goes into the file name
+def forked():
+    if tracer is not None and tracer.file is None:
+        tracer.pid = os.getpid()
+        tracer.pending = []
+        if "{pid}" not in tracer.path:
+            root, ext = os.path.splitext(tracer.path)
+            tracer.path = root + "-{pid}" + ext
+
+
+# Decorator recording every call of a function as a span
+def traced(name):
+    def decorate(function):
+        if tracer is None:
+            return function
+
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.complete(name, start, time.time())
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorate
+
+
+# Returns a context manager recording a block of code as a span
+def span(name, **args):
+    if tracer is None:
+        return NULL_SPAN
+    return Span(name, args)
+
+
+class StartupTrace:
+    """Time the start-up phases until the first banner window is mapped.
+
+    Reported with --startup-trace. The bin script starts the clock, so
+    interpreter start-up past the first line, a failed hand-over to a
+    running banner and parsing the configuration are all counted.
+    """
+
+    def __init__(self, start):
+        self.last = start
+        self.start = start
+        self.phases = []
+
+    # Close the current phase
+    def mark(self, phase):
+        now = time.time()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    # Called once the first banner window is on screen, see
+    # DisplayBanner.populate
+    def mapped(self):
+        self.mark("first map")
+        for phase, seconds in self.phases:
+            self.report(phase, seconds)
+        self.report("total", self.last - self.start)
+        return False
+
+    def report(self, phase, seconds):
+        sys.stderr.write("startup-trace: %-14s %8.1f ms\n" % (phase, seconds * 1000))
@@ -0,0 +1,85 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+
+import ctypes
+import ctypes.util
+import os
+import struct
+
+from classification_banner import mainloop
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+# Seconds between checks where inotify is not available
+POLL_INTERVAL = 5
+
+
+# Returns an inotify descriptor watching a directory, or None
+def inotify_watch(directory, mask):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, directory.encode(), mask) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class ConfigWatcher:
+    """Call back whenever a configuration file is rewritten.
+
+    The directory holding the file is watched with inotify so that files
+    replaced by a rename (as most editors and configuration management
+    tools do) are noticed as well. Where inotify is not available the
+    file is polled instead. The callback is expected to find out whether
+    the content actually changed.
+    """
+
+    def __init__(self, path, callback):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.callback = callback
+        self.fd = inotify_watch(os.path.dirname(path), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if self.fd is not None:
+            self.source = mainloop.get().io_add_watch(self.fd, self.read_events)
+        else:
+            self.source = mainloop.get().timeout_add_seconds(POLL_INTERVAL, self.poll)
+
+    def read_events(self, fd, condition):
+        try:
+            data = os.read(fd, 4096)
+        except OSError:
+            return True
+        offset = 0
+        changed = False
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name == self.name.encode():
+                changed = True
+        if changed:
+            self.callback()
+        return True
+
+    def poll(self):
+        self.callback()
+        return True
+
+    # Stop watching
+    def destroy(self):
+        mainloop.get().source_remove(self.source)
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,465 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+# Lean backend: draws the banners by talking to the X server directly
+# through python-xlib, without loading GTK, GObject, cairo or Pango. It
+# shares the configuration, layout engine and system info fields with the
+# GTK backend in banner.py and plugs into the same DisplayBanner (see
+# display.py), with plain X windows and core fonts:
+#
+#   create      XlibBackend.create_banner()
+#   move/resize XlibBanner.place()
+#   draw text   XlibBanner.draw()
+#   screen      RandR ScreenChangeNotify -> XlibBackend.watch_screen()
+#
+# It runs on a SelectLoop (see mainloop.py) with the X connection as one
+# of its watches. Select it with --backend xlib.
+#
+
+import sys
+import time
+from argparse import Namespace
+from xml.sax.saxutils import unescape
+
+# Start-up phases are timed from here unless the caller started the
+# clock earlier, see StartupTrace
+START_TIME = time.time()
+
+from Xlib import X, XK, Xatom, Xutil
+from Xlib import display as xdisplay
+from Xlib import error as xerror
+
+from classification_banner import mainloop
+from classification_banner.display import serve
+from classification_banner.geometry import Topology
+from classification_banner.sysinfo import live_info
+from classification_banner.tracing import StartupTrace, traced
+
+# Space above and below the text, and on the sides, in pixels
+PADDING = 2
+SIDE_PADDING = 20
+
+# Pixel sizes for the Pango size names accepted by the size option
+FONT_SIZES = {
+    "xx-small": 8,
+    "x-small": 10,
+    "small": 12,
+    "medium": 14,
+    "large": 17,
+    "x-large": 20,
+    "xx-large": 24,
+}
+
+# Families tried after the configured face
+FALLBACK_FACES = ["helvetica", "dejavu sans"]
+
+ESC_TEXT = "(ESC to hide temporarily)"
+
+
+# Returns the pixel size for a font size option ("small", "12", "12000")
+def font_pixels(size):
+    if size in FONT_SIZES:
+        return FONT_SIZES[size]
+    try:
+        points = float(size)
+    except ValueError:
+        return FONT_SIZES["small"]
+    # Pango markup sizes are in 1024ths of a point
+    if points > 100:
+        points /= 1024.0
+    return int(round(points * 96 / 72))
+
+
+class XlibStyle:
+    """The colors and fonts of a set of options, shared by every banner
+    drawn with them."""
+
+    def __init__(self, backend, options):
+        colormap = backend.screen.default_colormap
+        self.fgcolor = backend.color(colormap, options.fgcolor, backend.screen.white_pixel)
+        self.bgcolor = backend.color(colormap, options.bgcolor, backend.screen.black_pixel)
+        self.font = backend.open_font(options.face, options.weight, font_pixels(options.size))
+        self.esc_font = backend.open_font("liberation-sans", "normal", FONT_SIZES["xx-small"])
+        ascent, descent = backend.metrics(self.font)
+        self.height = ascent + descent + 2 * PADDING
+
+
+class XlibBanner:
+    """A banner window drawn with core X fonts."""
+
+    @traced("XlibBanner.__init__")
+    def __init__(self, backend, options, x, y, width, escape=None):
+        self.backend = backend
+        self.options = options
+        self.escape = escape
+        self.style = style = backend.style(options)
+        self.x, self.y, self.width = x, y, width
+        self.height = style.height
+        self.centerStatus = "center"
+        self.info_texts = None
+        self.struts = None
+
+        events = X.ExposureMask | X.StructureNotifyMask
+        if options.esc:
+            events |= X.KeyPressMask
+        if options.click_to_move:
+            events |= X.ButtonPressMask
+        self.window = backend.root.create_window(
+            x, y, width, self.height, 0, backend.screen.root_depth,
+            X.InputOutput, X.CopyFromParent,
+            background_pixel=style.bgcolor, event_mask=events)
+        self.gc = self.window.create_gc(foreground=style.fgcolor,
+                                        background=style.bgcolor,
+                                        font=style.font)
+        self.esc_gc = None
+        if options.esc and not options.sys_info:
+            self.esc_gc = self.window.create_gc(foreground=style.fgcolor,
+                                                background=style.bgcolor,
+                                                font=style.esc_font)
+
+        # The same window manager hints as the GTK banner: undecorated,
+        # above other windows, on every desktop and not in the task bar
+        self.window.set_wm_name("classification-banner")
+        self.window.set_wm_class("classification-banner", "Classification-banner")
+        self.window.set_wm_hints(flags=Xutil.InputHint, input=1)
+        self.window.set_wm_normal_hints(flags=Xutil.USPosition | Xutil.PPosition | Xutil.PSize,
+                                        x=x, y=y, width=width, height=self.height)
+        self.window.change_property(backend.atom("_MOTIF_WM_HINTS"), backend.atom("_MOTIF_WM_HINTS"),
+                                    32, [2, 0, 0, 0, 0])
+        self.window.change_property(backend.atom("_NET_WM_STATE"), Xatom.ATOM, 32,
+                                    [backend.atom("_NET_WM_STATE_ABOVE"),
+                                     backend.atom("_NET_WM_STATE_STICKY"),
+                                     backend.atom("_NET_WM_STATE_SKIP_TASKBAR"),
+                                     backend.atom("_NET_WM_STATE_SKIP_PAGER")])
+        self.window.change_property(backend.atom("_NET_WM_DESKTOP"), Xatom.CARDINAL, 32,
+                                    [0xFFFFFFFF])
+        self.set_opacity(options.opacity)
+
+        if options.sys_info:
+            live_info.subscribe(self.show_info, self.templates())
+        backend.windows[self.window.id] = self
+
+    def templates(self):
+        return (self.options.sys_info_left, self.options.sys_info_right)
+
+    def show(self):
+        self.window.map()
+
+    def hide(self):
+        self.window.unmap()
+
+    # Call `callback()` once the window is on screen
+    def notify_mapped(self, callback):
+        self.backend.map_callbacks[self.window.id] = callback
+
+    def set_opacity(self, opacity):
+        if opacity < 1:
+            self.window.change_property(self.backend.atom("_NET_WM_WINDOW_OPACITY"),
+                                        Xatom.CARDINAL, 32, [int(opacity * 0xFFFFFFFF)])
+            self.window.delete_property(self.backend.atom("_NET_WM_OPAQUE_REGION"))
+        else:
+            self.window.delete_property(self.backend.atom("_NET_WM_WINDOW_OPACITY"))
+            self.mark_opaque()
+
+    # Tell the compositor that the whole window is opaque
+    def mark_opaque(self):
+        self.window.change_property(self.backend.atom("_NET_WM_OPAQUE_REGION"), Xatom.CARDINAL,
+                                    32, [0, 0, self.width, self.height])
+
+    # Keep other windows from being placed underneath the banner, or take
+    # the space back (values None)
+    def reserve(self, values):
+        if values == self.struts:
+            return
+        self.struts = values
+        if values is None:
+            self.window.delete_property(self.backend.atom("_NET_WM_STRUT_PARTIAL"))
+            self.window.delete_property(self.backend.atom("_NET_WM_STRUT"))
+            return
+        self.window.change_property(self.backend.atom("_NET_WM_STRUT_PARTIAL"), Xatom.CARDINAL,
+                                    32, values)
+        self.window.change_property(self.backend.atom("_NET_WM_STRUT"), Xatom.CARDINAL,
+                                    32, values[:4])
+
+    # Move and Resize the Window in Place (Display Banner Relayout)
+    def place(self, x, y, width):
+        self.x, self.y, self.width = x, y, width
+        self.centerStatus = "center"
+        self.window.configure(x=x, y=y, width=width, height=self.height)
+        if self.options.opacity >= 1:
+            self.mark_opaque()
+
+    # Change the text, font and colors of the banner in place (see
+    # ClassificationBanner.restyle)
+    def restyle(self, message, fgcolor, bgcolor, face, size, weight, opacity):
+        values = dict(vars(self.options), message=message, fgcolor=fgcolor, bgcolor=bgcolor,
+                      face=face, size=size, weight=weight, opacity=opacity)
+        old, self.options = self.options, Namespace(**values)
+        self.style = style = self.backend.style(self.options)
+        old_height, self.height = self.height, style.height
+        self.gc.change(foreground=style.fgcolor, background=style.bgcolor, font=style.font)
+        if self.esc_gc is not None:
+            self.esc_gc.change(foreground=style.fgcolor, background=style.bgcolor)
+        self.window.change_attributes(background_pixel=style.bgcolor)
+        if self.height != old_height:
+            # A new font, see DisplayBanner.apply
+            self.window.configure(height=self.height)
+        if opacity != old.opacity:
+            self.set_opacity(opacity)
+        self.draw()
+
+    # Returns the (text, alignment, gc, font) pieces of the banner
+    def texts(self):
+        style = self.style
+        texts = [(self.options.message, "center", self.gc, style.font)]
+        if self.options.sys_info:
+            if self.info_texts is None:
+                self.info_texts = tuple(live_info.get(self.templates()))
+            texts.append((unescape(self.info_texts[0]), "left", self.gc, style.font))
+            texts.append((unescape(self.info_texts[1]), "right", self.gc, style.font))
+        elif self.esc_gc is not None:
+            texts.append((ESC_TEXT, "left", self.esc_gc, style.esc_font))
+        return texts
+
+    def draw(self):
+        self.window.clear_area()
+        for text, alignment, gc, font in self.texts():
+            if not text:
+                continue
+            ascent, descent = self.backend.metrics(font)
+            text_width = self.backend.text_width(font, text)
+            if alignment == "left":
+                x = SIDE_PADDING
+            elif alignment == "right":
+                x = self.width - text_width - SIDE_PADDING
+            else:
+                x = (self.width - text_width) // 2
+            y = (self.height - ascent - descent) // 2 + ascent
+            self.window.draw_text(gc, x, y, text)
+
+    # Redraw with new system info text (called by the shared tick)
+    def show_info(self, left, right):
+        if (left, right) != self.info_texts:
+            self.info_texts = (left, right)
+            self.draw()
+
+    def handle(self, event):
+        if event.type == X.Expose:
+            if event.count == 0:
+                self.draw()
+        elif event.type == X.KeyPress:
+            keysym = self.backend.display.keycode_to_keysym(event.detail, 0)
+            # Press ESC to hide window for 15 seconds
+            if keysym == XK.XK_Escape and self.escape is not None:
+                self.escape(self)
+        elif event.type == X.ButtonPress:
+            self.mouseclick(event.detail)
+
+    def mouseclick(self, button):
+        if button != 1:
+            return
+        if self.centerStatus == "center":
+            self.x -= 300
+            self.centerStatus = "left"
+        elif self.centerStatus == "left":
+            self.x += 600
+            self.centerStatus = "right"
+        elif self.centerStatus == "right":
+            self.x -= 300
+            self.centerStatus = "center"
+        self.window.configure(x=self.x)
+
+    def destroy(self):
+        if self.options.sys_info:
+            live_info.unsubscribe(self.show_info)
+        self.backend.windows.pop(self.window.id, None)
+        self.backend.map_callbacks.pop(self.window.id, None)
+        self.window.destroy()
+
+
+class XlibBackend:
+    """Banner windows drawn on one X screen without GTK (see display.py).
+
+    Monitors come from RandR (or Xinerama). The X connection is a watch
+    of the main loop; events already read from it are handled, and the
+    requests queued by the banners are flushed, before the loop blocks.
+    There is no watermark, which needs cairo.
+    """
+
+    name = "xlib"
+    watermarks = False
+
+    def __init__(self):
+        self.display = xdisplay.Display()
+        self.screen = self.display.screen()
+        self.root = self.screen.root
+        self.atoms = {}
+        self.extents = {}
+        self.fonts = {}
+        self.styles = {}
+
+        # Banner windows by X window id, and the callbacks waiting for
+        # them to be mapped
+        self.windows = {}
+        self.map_callbacks = {}
+
+        self.screen_changed = None
+        self.randr = self.display.has_extension("RANDR")
+        if self.randr:
+            from Xlib.ext import randr
+            self.root.xrandr_select_input(randr.RRScreenChangeNotifyMask)
+
+        loop = mainloop.get()
+        loop.io_add_watch(self.display, self.readable)
+        loop.add_prepare(self.prepare)
+
+    # Returns the pixel value of a color name or #RRGGBB specification
+    def color(self, colormap, name, fallback):
+        try:
+            color = colormap.alloc_named_color(name)
+        except xerror.XError:
+            color = None
+        if color is None:
+            sys.stderr.write("classification-banner: unknown color %s\n" % name)
+            return fallback
+        return color.pixel
+
+    # Returns an error message if an update holds a color the X server
+    # does not know
+    def color_error(self, values):
+        colormap = self.screen.default_colormap
+        for key in ("fgcolor", "bgcolor"):
+            if key in values:
+                try:
+                    colormap.lookup_color(values[key])
+                except xerror.XError:
+                    return "%s: unknown color %r" % (key, values[key])
+        return None
+
+    # Returns a core font close to the Pango face, weight and size
+    def open_font(self, face, weight, pixels):
+        key = (face, weight, pixels)
+        if key in self.fonts:
+            return self.fonts[key]
+        weight = "bold" if weight == "bold" else "medium"
+        font = None
+        for family in [face.replace("-", " ")] + FALLBACK_FACES:
+            for size in [str(pixels), "*"]:
+                pattern = "-*-%s-%s-r-normal--%s-*-*-*-*-*-iso8859-1" % (family, weight, size)
+                names = self.display.list_fonts(pattern, 1)
+                if names:
+                    font = self.display.open_font(names[0])
+                    break
+            if font is not None:
+                break
+        if font is None:
+            font = self.display.open_font("fixed")
+        self.fonts[key] = font
+        return font
+
+    # Returns the XlibStyle of a set of options
+    def style(self, options):
+        key = (options.fgcolor, options.bgcolor, options.face, options.size, options.weight)
+        if key not in self.styles:
+            self.styles[key] = XlibStyle(self, options)
+        return self.styles[key]
+
+    # Returns the (ascent, descent) of a font
+    def metrics(self, font):
+        key = ("metrics", font.id)
+        if key not in self.extents:
+            info = font.query()
+            self.extents[key] = (info.font_ascent, info.font_descent)
+        return self.extents[key]
+
+    def text_width(self, font, text):
+        key = (font.id, text)
+        if key not in self.extents:
+            if len(self.extents) > 256:
+                self.extents.clear()
+            self.extents[key] = font.query_text_extents(text).overall_width
+        return self.extents[key]
+
+    def atom(self, name):
+        if name not in self.atoms:
+            self.atoms[name] = self.display.intern_atom(name)
+        return self.atoms[name]
+
+    # Returns the Topology of the screen
+    def topology(self):
+        geometry = self.root.get_geometry()
+        monitors, primary = None, 0
+        if self.randr:
+            try:
+                reply = self.root.xrandr_get_monitors(is_active=True)
+                monitors = tuple((m.x, m.y, m.width_in_pixels, m.height_in_pixels)
+                                 for m in reply.monitors)
+                for i, monitor in enumerate(reply.monitors):
+                    if monitor.primary:
+                        primary = i
+            except (AttributeError, xerror.XError):
+                monitors = None
+        if not monitors and self.display.has_extension("XINERAMA"):
+            reply = self.display.xinerama_query_screens()
+            monitors = tuple((s.x, s.y, s.width, s.height) for s in reply.screens)
+        if not monitors:
+            monitors = ((0, 0, geometry.width, geometry.height),)
+        return Topology(geometry.width, geometry.height, monitors, primary)
+
+    def watch_screen(self, callback):
+        self.screen_changed = callback
+
+    # Returns an unmapped banner for a Window of the layout
+    def create_banner(self, options, window, escape):
+        return XlibBanner(self, options, window.x, window.y, window.width, escape)
+
+    def flush(self):
+        self.display.flush()
+
+    def close(self):
+        self.screen_changed = None
+
+    # The X connection is readable: handle what came in
+    def readable(self, source, condition):
+        self.prepare()
+        return True
+
+    def prepare(self):
+        while self.display.pending_events():
+            self.dispatch(self.display.next_event())
+        self.display.flush()
+
+    def dispatch(self, event):
+        if self.randr and event.type == self.display.extension_event.ScreenChangeNotify:
+            if self.screen_changed is not None:
+                self.screen_changed()
+            return
+        window = getattr(event, "window", None)
+        if window is None:
+            return
+        if event.type == X.MapNotify and window.id in self.map_callbacks:
+            self.map_callbacks.pop(window.id)()
+        banner = self.windows.get(window.id)
+        if banner is not None:
+            banner.handle(event)
+
+
+# Options the xlib backend does not support
+UNSUPPORTED = [
+    ("watermark", "draws no watermark"),
+]
+
+
+# `trace` is the StartupTrace started by the bin script, if any
+def main(configuration, trace=None):
+    if trace is None:
+        trace = StartupTrace(START_TIME)
+    trace.mark("import")
+    options = configuration.options
+    for key, what in UNSUPPORTED:
+        if getattr(options, key):
+            sys.stderr.write("classification-banner: the xlib backend %s, use --backend gtk\n" % what)
+
+    # Everything is scheduled on select(), GLib is never loaded
+    mainloop.use(mainloop.SelectLoop())
+    serve(configuration, trace, XlibBackend)
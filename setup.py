@@ -47,6 +47,9 @@ environments such as GNOME2, GNOME3, KDE, twm, icewm, and Cinnamon.""",
     ],
     packages=find_packages(),
     scripts=["bin/classification-banner"],
+    extras_require={
+        "xlib": ["python-xlib"],
+    },
     data_files=[('share', ['share/classification-banner-screenshot.png']),
                 ('contrib', ['contrib/banner.conf', 'contrib/classification-banner.desktop'])
                 ],
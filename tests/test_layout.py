@@ -0,0 +1,104 @@
+#
+# Copyright (C) 2020 classification-banner Contributors. See LICENSE for license
+#
+# Banner placement, struts and layout diffs. No X server is needed:
+#
+#   python -m unittest discover tests
+#
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from classification_banner.geometry import Topology
+from classification_banner.layout import by_monitor, compute_layout, diff_layout, strut
+
+HEIGHT = 30
+
+
+# Returns the topology of a screen made of some monitors
+def topology(*monitors):
+    width = max(x + w for x, y, w, h in monitors)
+    height = max(y + h for x, y, w, h in monitors)
+    return Topology(width, height, tuple(monitors), 0)
+
+
+# Returns the struts of every banner of a topology as {(monitor, position): values}
+def struts(screen):
+    layout = by_monitor(compute_layout(screen))
+    return dict(((index, position), strut(window, HEIGHT, screen))
+                for index, windows in layout.items()
+                for position, window in windows.items())
+
+
+class StrutTest(unittest.TestCase):
+
+    def test_single_monitor(self):
+        screen = topology((0, 0, 1920, 1080))
+        self.assertEqual(struts(screen), {
+            (0, "top"): [0, 0, 30, 0, 0, 0, 0, 0, 0, 1919, 0, 0],
+            (0, "bottom"): [0, 0, 0, 30, 0, 0, 0, 0, 0, 0, 0, 1919],
+        })
+
+    # The bottom strut of a short monitor next to a tall one covers the
+    # part of the screen below it
+    def test_monitors_of_different_height(self):
+        screen = topology((0, 0, 1920, 1080), (1920, 0, 1920, 2160))
+        values = struts(screen)
+        self.assertEqual(values[0, "bottom"], [0, 0, 0, 1110, 0, 0, 0, 0, 0, 0, 0, 1919])
+        self.assertEqual(values[1, "bottom"], [0, 0, 0, 30, 0, 0, 0, 0, 0, 0, 1920, 3839])
+        self.assertEqual(values[0, "top"], values[1, "top"][:8] + [0, 1919, 0, 0])
+
+    # Banners between two stacked monitors reserve nothing
+    def test_stacked_monitors(self):
+        screen = topology((0, 0, 1920, 1080), (0, 1080, 1920, 1080))
+        values = struts(screen)
+        self.assertEqual(values[0, "bottom"], None)
+        self.assertEqual(values[1, "top"], None)
+        self.assertEqual(values[0, "top"], [0, 0, 30, 0, 0, 0, 0, 0, 0, 1919, 0, 0])
+        self.assertEqual(values[1, "bottom"], [0, 0, 0, 30, 0, 0, 0, 0, 0, 0, 0, 1919])
+
+    # A monitor that does not change can still need new struts when
+    # another one is plugged in
+    def test_struts_follow_the_topology(self):
+        before = struts(topology((0, 0, 1920, 1080)))
+        after = struts(topology((0, 0, 1920, 1080), (1920, 0, 1920, 2160)))
+        self.assertNotEqual(before[0, "bottom"], after[0, "bottom"])
+
+
+class DiffLayoutTest(unittest.TestCase):
+
+    def layout(self, *monitors):
+        return by_monitor(compute_layout(topology(*monitors)))
+
+    def test_unchanged(self):
+        old = self.layout((0, 0, 1920, 1080), (1920, 0, 1920, 1080))
+        new = self.layout((0, 0, 1920, 1080), (1920, 0, 1920, 1080))
+        self.assertEqual(diff_layout(old, new), ([], [], []))
+
+    def test_monitor_added(self):
+        old = self.layout((0, 0, 1920, 1080), (1920, 0, 1920, 1080))
+        new = self.layout((0, 0, 1920, 1080), (1920, 0, 1920, 1080), (3840, 0, 1280, 1024))
+        self.assertEqual(diff_layout(old, new), ([], [], [2]))
+
+    def test_monitor_removed(self):
+        old = self.layout((0, 0, 1920, 1080), (1920, 0, 1920, 1080), (3840, 0, 1280, 1024))
+        new = self.layout((0, 0, 1920, 1080), (1920, 0, 1920, 1080))
+        self.assertEqual(diff_layout(old, new), ([2], [], []))
+
+    # Only the monitor that changed size is moved; the other one keeps its
+    # banners (and gets new struts from the backend, see StrutTest)
+    def test_monitor_resized(self):
+        old = self.layout((0, 0, 1920, 1080), (1920, 0, 1920, 1080))
+        new = self.layout((0, 0, 1920, 1080), (1920, 0, 2560, 1440))
+        self.assertEqual(diff_layout(old, new), ([], [1], []))
+
+    def test_first_layout(self):
+        new = self.layout((0, 0, 1920, 1080), (1920, 0, 1920, 1080))
+        self.assertEqual(diff_layout({}, new), ([], [], [0, 1]))
+
+
+if __name__ == "__main__":
+    unittest.main()